@@ -0,0 +1,146 @@
+"""
+    Benchmarks of the lexer, parser and evaluators.
+
+    python benchmarks.py --output results.json
+    python benchmarks.py --compare results.json --threshold 0.1
+"""
+import argparse
+import json
+import platform
+import sys
+import timeit
+
+from syntax_processor_condition import compile
+from syntax_processor_index import IndexedRuleSet
+from syntax_processor_lexer import ProcessorLexer
+from syntax_processor_parser import ProcessorParser
+from syntax_processor_ruleset import RuleSet
+from syntax_processor_scanner import ProcessorScanner
+
+
+FORMAT_VERSION = 1
+
+TYPICAL = '(status == 3) and level > 5 or region in (1, 2, 4) and not (flag)'
+REUSED = '(level > 2 and level < 9) and (status == 3) and level + status > region'
+NESTED = '(' * 200 + 'a + 1' + ')' * 200
+LONG = ' + '.join(f'a{number} * 0x{number:x}' for number in range(2000))
+NAMES = {'status': 3, 'level': 7, 'region': 2, 'flag': 0, 'a': 1}
+
+
+def parse(text):
+    parser = ProcessorParser()
+    parser.names = dict(NAMES)
+    return parser.parse(ProcessorLexer().tokenize(text))
+
+
+def make_rules(count):
+    return {number: f'(status == {number % 50}) and level > {number % 10} and region in ({number % 7}, 8)'
+            for number in range(count)}
+
+
+def benchmarks():
+    """
+        Gives {name: setup} of the benchmarks, setup() prepares the data
+        and gives the function to time, it takes no arguments
+    """
+    cases = {
+        'lexer.tokenize.long': lambda: lambda: list(ProcessorLexer().tokenize(LONG)),
+        'scanner.scan.long': lambda: lambda: ProcessorScanner().scan(LONG),
+        'parser.parse.typical': lambda: lambda: parse(TYPICAL),
+        'parser.parse.nested': lambda: lambda: parse(NESTED),
+        'compile.typical': lambda: lambda: compile(TYPICAL),
+    }
+    for backend in ('tree', 'code', 'slots'):
+        cases[f'evaluate.{backend}.typical'] = lambda backend=backend: evaluate(compile(TYPICAL, backend=backend))
+        cases[f'evaluate.{backend}.reused'] = lambda backend=backend: evaluate(compile(REUSED, backend=backend))
+    cases['evaluate.values.typical'] = lambda: evaluate_values(compile(TYPICAL, backend='slots'))
+    for size in (10, 1000, 10000):
+        text = 'a in (' + ', '.join(str(number) for number in range(size)) + ')'
+        cases[f'parser.parse.in{size}'] = lambda text=text: lambda: parse(text)
+        cases[f'evaluate.tree.in{size}'] = lambda text=text, size=size: evaluate(compile(text), {'a': size - 1})
+    for kind in (RuleSet, IndexedRuleSet):
+        cases[f'{kind.__name__}.match.1000'] = lambda kind=kind: match(kind(make_rules(1000)))
+    return cases
+
+
+def evaluate(condition, names=NAMES):
+    return lambda: condition.evaluate(names)
+
+
+def evaluate_values(condition, names=NAMES):
+    values = condition.bind(names)
+    return lambda: condition.evaluate_values(values)
+
+
+def match(rule_set):
+    rule_set.match(NAMES)
+    return lambda: rule_set.match(NAMES)
+
+
+def measure(function, repeat=5, min_time=0.2):
+    """
+        Gives seconds per call as the best and the median of repeat runs
+    """
+    timer = timeit.Timer(function)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    times = sorted(time / number for time in timer.repeat(repeat, number))
+    return {'best': times[0], 'median': times[len(times) // 2], 'number': number}
+
+
+def run(names=None, repeat=5, min_time=0.2):
+    results = {}
+    for name, setup in benchmarks().items():
+        if names and not any(part in name for part in names):
+            continue
+        results[name] = measure(setup(), repeat, min_time)
+        print(f'{name:32} {results[name]["best"] * 1e6:12.2f} us', file=sys.stderr)
+    return {'version': FORMAT_VERSION, 'python': platform.python_version(), 'results': results}
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+        Gives [(name, baseline seconds, current seconds, ratio, regressed)] for benchmarks of both runs,
+        a benchmark regressed when it is slower than the baseline by more than threshold
+    """
+    if baseline.get('version') != FORMAT_VERSION:
+        raise ValueError(f'Unsupported results version {baseline.get("version")!r}')
+    rows = []
+    for name, result in current['results'].items():
+        if name not in baseline['results']:
+            continue
+        before = baseline['results'][name]['best']
+        after = result['best']
+        ratio = after / before
+        rows.append((name, before, after, ratio, ratio > 1 + threshold))
+    return rows
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arguments.add_argument('names', nargs='*', help='run only benchmarks containing one of the names')
+    arguments.add_argument('--output', help='write results to the JSON file')
+    arguments.add_argument('--compare', help='compare with results from the JSON file')
+    arguments.add_argument('--threshold', type=float, default=0.1, help='allowed slowdown, 0.1 is 10%%')
+    arguments.add_argument('--repeat', type=int, default=5)
+    arguments.add_argument('--min-time', type=float, default=0.2, help='seconds of every repeat')
+    options = arguments.parse_args(argv)
+
+    results = run(options.names, options.repeat, options.min_time)
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    if not options.compare:
+        return 0
+    with open(options.compare) as file:
+        baseline = json.load(file)
+    regressions = 0
+    for name, before, after, ratio, regressed in compare(baseline, results, options.threshold):
+        regressions += regressed
+        mark = 'REGRESSION' if regressed else ''
+        print(f'{name:32} {before * 1e6:12.2f} us {after * 1e6:12.2f} us {ratio:7.2f}x {mark}')
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
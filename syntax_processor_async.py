@@ -0,0 +1,171 @@
+import asyncio
+from collections.abc import Mapping, MutableMapping
+
+from syntax_processor_condition import Condition, compile
+from syntax_processor_functions import call
+from syntax_processor_nodes import (BINARY_OPERATORS, AdaptiveAnd, And, ArgList, Assign, BinOp, Call, In, InSet,
+                                    Name, Negate, Not, Or, member)
+
+
+MISSING = object()
+
+
+def combine(node, values, names):
+    """
+        Gives the value of the node from the values of its children
+    """
+    if isinstance(node, BinOp):
+        return BINARY_OPERATORS[node.op](*values)
+    if isinstance(node, Negate):
+        return -values[0]
+    if isinstance(node, ArgList):
+        return list(values)
+    if isinstance(node, In):
+        return values[0] in (values[1] if len(values) > 1 else None)
+    if isinstance(node, InSet):
+        return member(values[0], node.values)
+    if isinstance(node, Call):
+        return call(node.name, values[0] if values else None)
+    if isinstance(node, Assign):
+        names[node.name] = values[0]
+        return None
+    raise TypeError(f'Unknown node {node!r}')
+
+
+class ResolvedNames(MutableMapping):
+    """
+        It is class that reads variables from names and from values fetched by this evaluation,
+        assignments are written to names
+    """
+
+    def __init__(self, names, fetches):
+        self.names = names
+        self.fetches = fetches
+
+    def __getitem__(self, name):
+        if name in self.names:
+            return self.names[name]
+        task = self.fetches.get(name)
+        if task is None or not task.done() or task.result() is MISSING:
+            raise KeyError(name)
+        return task.result()
+
+    def __setitem__(self, name, value):
+        self.names[name] = value
+
+    def __delitem__(self, name):
+        del self.names[name]
+
+    def __iter__(self):
+        return iter(self.names)
+
+    def __len__(self):
+        return len(self.names)
+
+
+class AsyncEvaluator:
+    """
+        It is class of one asynchronous evaluation. Variables missing at names are fetched
+        from the resolver at most once per evaluation. Variables that a subtree needs
+        in any case are fetched concurrently before it is evaluated, operands of "and"/"or"
+        that do not decide the result fetch nothing
+    """
+
+    def __init__(self, names, resolver, errors):
+        self.names = names
+        self.resolver = resolver
+        self.errors = errors
+        self.resolved = ResolvedNames(names, {})
+        self.fetches = self.resolved.fetches
+        self.strict = {}
+        self.lazy = {}
+
+    def strict_variables(self, node):
+        """
+            Gives the variables read by the subtree whatever values they have
+        """
+        key = id(node)
+        if key not in self.strict:
+            if isinstance(node, Name):
+                result = {node.name}
+            elif isinstance(node, (And, Or)):
+                result = self.strict_variables(node.left)
+            elif isinstance(node, AdaptiveAnd):
+                result = self.strict_variables(node.order[0][0])
+            else:
+                result = set().union(*map(self.strict_variables, node.children()))
+            self.strict[key] = result
+        return self.strict[key]
+
+    def has_lazy(self, node):
+        """
+            Tells whether the subtree has "and"/"or" operands that may be not evaluated
+        """
+        key = id(node)
+        if key not in self.lazy:
+            self.lazy[key] = isinstance(node, (And, Or, AdaptiveAnd)) or any(map(self.has_lazy, node.children()))
+        return self.lazy[key]
+
+    def callback(self, name):
+        if isinstance(self.resolver, Mapping):
+            return self.resolver.get(name)
+        if self.resolver is None:
+            return None
+        return lambda: self.resolver(name)
+
+    async def fetch(self, callback):
+        try:
+            return await callback()
+        except LookupError:
+            return MISSING
+
+    async def prefetch(self, node):
+        tasks = []
+        for name in self.strict_variables(node):
+            if name in self.names:
+                continue
+            task = self.fetches.get(name)
+            if task is None:
+                callback = self.callback(name)
+                if callback is None:
+                    continue
+                task = self.fetches[name] = asyncio.ensure_future(self.fetch(callback))
+            tasks.append(task)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    async def evaluate(self, node):
+        await self.prefetch(node)
+        if not self.has_lazy(node):
+            return node.evaluate(self.resolved, self.errors)
+        if isinstance(node, (And, Or)):
+            value = bool(await self.evaluate(node.left))
+            if value is isinstance(node, Or):
+                return value
+            return bool(await self.evaluate(node.right))
+        if isinstance(node, AdaptiveAnd):
+            for entry in node.order:
+                if bool(await self.evaluate(entry[0])) is node.short_circuit:
+                    return node.short_circuit
+            return not node.short_circuit
+        if isinstance(node, Not):
+            return not bool(await self.evaluate(node.operand))
+        values = [await self.evaluate(child) for child in node.children()]
+        return combine(node, values, self.names)
+
+
+async def evaluate_async(condition, names=None, resolver=None, errors=None):
+    """
+        Evaluates the condition, variables missing at names are awaited from the resolver:
+        an async function resolver(name) or a mapping {name: async function()}.
+        A resolver raising LookupError leaves the variable undefined
+    """
+    if not isinstance(condition, Condition):
+        condition = compile(condition)
+    if condition.tree is None:
+        return None
+    if names is None:
+        names = {}
+    if errors is None:
+        errors = []
+    return await AsyncEvaluator(names, resolver, errors).evaluate(condition.tree)
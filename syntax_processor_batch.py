@@ -0,0 +1,153 @@
+import numpy as np
+
+from syntax_processor_condition import Condition, compile
+from syntax_processor_nodes import AdaptiveAnd, And, Or
+
+
+ARRAY_FUNCTIONS = {
+    'min': lambda *args: np.minimum.reduce(np.broadcast_arrays(*args)),
+    'max': lambda *args: np.maximum.reduce(np.broadcast_arrays(*args)),
+    'abs': np.abs,
+    'any': lambda *args: np.logical_or.reduce(np.broadcast_arrays(*args)),
+    'all': lambda *args: np.logical_and.reduce(np.broadcast_arrays(*args)),
+}
+
+ARRAY_OPERATORS = {
+    '+': np.add,
+    '-': np.subtract,
+    '*': np.multiply,
+    '>': np.greater,
+    '<': np.less,
+    '==': np.equal,
+    '!=': np.not_equal,
+    '>=': np.greater_equal,
+    '<=': np.less_equal,
+}
+
+
+ARITHMETIC = {'+', '-', '*', '/'}
+
+
+def numeric(value):
+    """
+        Gives bool values as ints, Python does arithmetic on bools like on ints
+    """
+    if isinstance(value, (bool, np.bool_)):
+        return int(value)
+    if isinstance(value, np.ndarray) and value.dtype == bool:
+        return value.astype(np.int64)
+    return value
+
+
+class BatchEvaluator:
+    """
+        It is class that evaluates a tree of nodes over columns of NumPy arrays at once.
+        Every method gives a pair (value, mask), the mask marks rows with undefined
+        variables or division by zero, it is False while no row is marked
+    """
+
+    def __init__(self, columns, size):
+        self.columns = columns
+        self.size = size
+
+    def evaluate(self, node):
+        method = getattr(self, 'evaluate_' + type(node).__name__, None)
+        if method is None:
+            raise ValueError(f'{type(node).__name__} statement can not be evaluated over columns')
+        return method(node)
+
+    def evaluate_Number(self, node):
+        return node.value, False
+
+    def evaluate_Name(self, node):
+        try:
+            column = self.columns[node.name]
+        except LookupError:
+            return np.zeros(self.size, dtype=np.int64), np.ones(self.size, dtype=bool)
+        return np.ma.getdata(column), np.ma.getmask(column) | False
+
+    def evaluate_BinOp(self, node):
+        left, left_mask = self.evaluate(node.left)
+        right, right_mask = self.evaluate(node.right)
+        mask = left_mask | right_mask
+        if node.op in ARITHMETIC:
+            left, right = numeric(left), numeric(right)
+        if node.op != '/':
+            return ARRAY_OPERATORS[node.op](left, right), mask
+        zero = np.equal(right, 0)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            value = np.true_divide(left, np.where(zero, 1, right))
+        return np.where(zero, 0.0, value), mask | zero
+
+    # rows where the left operand decides the result do not take errors of the right operand
+    def evaluate_And(self, node):
+        left, left_mask = self.evaluate(node.left)
+        right, right_mask = self.evaluate(node.right)
+        left = np.asarray(left, dtype=bool)
+        return np.logical_and(left, right), left_mask | (right_mask & left)
+
+    def evaluate_Or(self, node):
+        left, left_mask = self.evaluate(node.left)
+        right, right_mask = self.evaluate(node.right)
+        left = np.asarray(left, dtype=bool)
+        return np.logical_or(left, right), left_mask | (right_mask & ~left)
+
+    def evaluate_InSet(self, node):
+        value, mask = self.evaluate(node.expr)
+        return np.isin(value, list(node.values)), mask
+
+    def evaluate_Call(self, node):
+        function = ARRAY_FUNCTIONS.get(node.name)
+        if function is None or node.arglist is None:
+            raise ValueError(f'Function {node.name!r} can not be evaluated over columns')
+        args = [self.evaluate(item) for item in node.arglist.items]
+        mask = False
+        for _, item_mask in args:
+            mask = mask | item_mask
+        return function(*(value for value, _ in args)), mask
+
+    def evaluate_AdaptiveAnd(self, node):
+        operands = iter(node.operands)
+        tree = next(operands)
+        for operand in operands:
+            tree = (And if type(node) is AdaptiveAnd else Or)(tree, operand)
+        return self.evaluate(tree)
+
+    evaluate_AdaptiveOr = evaluate_AdaptiveAnd
+
+    def evaluate_Not(self, node):
+        value, mask = self.evaluate(node.operand)
+        return np.logical_not(value), mask
+
+    def evaluate_Negate(self, node):
+        value, mask = self.evaluate(node.operand)
+        return np.negative(numeric(value)), mask
+
+    def evaluate_In(self, node):
+        value, mask = self.evaluate(node.expr)
+        items = [] if node.arglist is None else [self.evaluate(item) for item in node.arglist.items]
+        for _, item_mask in items:
+            mask = mask | item_mask
+        if all(np.ndim(item) == 0 for item, _ in items):
+            return np.isin(value, [item for item, _ in items]), mask
+        result = np.zeros(self.size, dtype=bool)
+        for item, _ in items:
+            result |= np.equal(value, item)
+        return result, mask
+
+
+def evaluate_batch(condition, columns, size=None):
+    """
+        Evaluates the condition over columns {name: array} and gives a masked array,
+        rows with undefined variables or division by zero are masked instead of aborting the batch
+    """
+    if not isinstance(condition, Condition):
+        condition = compile(condition)
+    if condition.tree is None:
+        raise ValueError(f'{condition.source!r} has no expression to evaluate')
+    if size is None:
+        size = len(next(iter(columns.values()))) if columns else 1
+    value, mask = BatchEvaluator(columns, size).evaluate(condition.tree)
+    value = np.broadcast_to(value, (size,)).copy()
+    mask = np.broadcast_to(mask, (size,)).copy()
+    return np.ma.MaskedArray(value, mask=mask)
@@ -0,0 +1,121 @@
+import re
+import sys
+import threading
+from collections import OrderedDict
+
+from syntax_processor_condition import compile
+
+
+def normalize(text):
+    """
+        Gives the key of the condition text, spaces and tabs around and between tokens
+        are ignored by the lexer, so they do not make a new entry
+    """
+    return re.sub(r'[ \t]+', ' ', text.strip())
+
+
+def sizeof(condition):
+    """
+        Estimates the number of bytes taken by the condition text and its tree
+    """
+    size = sys.getsizeof(condition) + sys.getsizeof(condition.source)
+    nodes = [] if condition.tree is None else [condition.tree]
+    while nodes:
+        node = nodes.pop()
+        size += sys.getsizeof(node)
+        if hasattr(node, '__dict__'):
+            size += sys.getsizeof(node.__dict__)
+        nodes.extend(node.children())
+    return size
+
+
+class ConditionCache:
+    """
+        It is class that keeps compiled conditions by their normalized text,
+        the least recently used conditions are evicted when max_entries or max_bytes is exceeded
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def get(self, text, backend='tree'):
+        """
+            Gives the compiled condition for the text, compiling it on a miss
+        """
+        key = (normalize(text), backend)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        condition = compile(key[0], backend)
+        size = sizeof(condition)
+        with self.lock:
+            if key not in self.entries:
+                self.entries[key] = (condition, size)
+                self.bytes += size
+                self.evict()
+            return condition
+
+    def evict(self):
+        while self.entries and (
+                (self.max_entries is not None and len(self.entries) > self.max_entries) or
+                (self.max_bytes is not None and self.bytes > self.max_bytes)):
+            _, (_, size) = self.entries.popitem(last=False)
+            self.bytes -= size
+            self.evictions += 1
+
+    def resize(self, max_entries=None, max_bytes=None):
+        """
+            Sets new limits, None means no limit
+        """
+        with self.lock:
+            self.max_entries = max_entries
+            self.max_bytes = max_bytes
+            self.evict()
+
+    def invalidate(self, text):
+        """
+            Removes the condition text compiled with any backend
+        """
+        text = normalize(text)
+        with self.lock:
+            for key in [key for key in self.entries if key[0] == text]:
+                _, size = self.entries.pop(key)
+                self.bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'entries': len(self.entries), 'bytes': self.bytes, 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, text):
+        return any(key[0] == normalize(text) for key in list(self.entries))
+
+
+cache = ConditionCache()
+
+
+def compile_cached(text, backend='tree'):
+    """
+        Compiles the text through the process-wide cache
+    """
+    return cache.get(text, backend)
@@ -0,0 +1,388 @@
+"""
+    Streams records of JSON Lines or CSV files through conditions.
+
+    python syntax_processor_cli.py -c 'level > 5' -c 'errors: status in (4, 5)' events.jsonl
+    python syntax_processor_cli.py -c 'level > 5' --annotate --summary < events.csv --format csv
+
+    A condition "name: text" is reported by its name, otherwise by its text.
+    Matching records are written to stdout, with --annotate every record is written
+    with the list of names of matching conditions.
+"""
+import argparse
+import csv
+import io
+import itertools
+import json
+import re
+import sys
+import time
+
+from syntax_processor_condition import Condition, compile
+from syntax_processor_metrics import Statistics
+from syntax_processor_nodes import Assign
+from syntax_processor_parallel import ParallelEvaluator
+from syntax_processor_ruleset import RuleSet
+from syntax_processor_types import TypeCheckError, normalize_schema
+
+
+BUFFER_SIZE = 1 << 20
+NAMED = re.compile(r'\s*([A-Za-z_][\w.-]*)\s*:(.*)', re.DOTALL)
+TRUE = {'1', 'true', 'yes', 'on'}
+
+
+def parse_condition(text):
+    """
+        Gives (name, text) of "name: text", a condition without a name is named by its text
+    """
+    match = NAMED.match(text)
+    if match:
+        return match[1], match[2].strip()
+    return text, text
+
+
+def parse_schema(text):
+    """
+        Gives the schema {name: type} of "name=type,name=type"
+    """
+    schema = {}
+    for item in filter(None, (item.strip() for item in text.split(','))):
+        name, _, kind = item.partition('=')
+        schema[name.strip()] = kind.strip()
+    return normalize_schema(schema)
+
+
+def convert(value, kind=None):
+    """
+        Converts a CSV value to the type of the schema, without it to int, float or the text
+    """
+    if kind is bool:
+        return value.strip().lower() in TRUE
+    if kind is list:
+        return json.loads(value)
+    if kind is not None:
+        return kind(value)
+    for kind in (int, float):
+        try:
+            return kind(value)
+        except ValueError:
+            pass
+    return value
+
+
+class JsonLinesReader:
+    """
+        It is class that reads records from lines of JSON objects
+    """
+
+    def __init__(self, file, schema=None):
+        self.file = file
+        self.fields = None
+
+    def records(self):
+        """
+            Gives (record, original line) of every line, lines that are not objects are reported and skipped
+        """
+        for lineno, line in enumerate(self.file, 1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                record = None
+            if not isinstance(record, dict):
+                print(f'{getattr(self.file, "name", "-")}:{lineno}: not a JSON object', file=sys.stderr)
+                continue
+            if self.fields is None:
+                self.fields = list(record)
+            yield record, line
+
+
+class CsvReader:
+    """
+        It is class that reads records from CSV rows with a header, values are converted by the schema
+    """
+
+    def __init__(self, file, schema=None):
+        self.reader = csv.DictReader(file)
+        self.schema = schema or {}
+        self.fields = None
+
+    def records(self):
+        """
+            Gives (record, original row) of every row, rows with values of wrong types are reported and skipped
+        """
+        schema = self.schema
+        self.fields = list(self.reader.fieldnames or ())
+        for row in self.reader:
+            try:
+                record = {name: convert(value, schema.get(name)) for name, value in row.items() if name is not None}
+            except ValueError as error:
+                print(f'{getattr(self.reader.reader, "line_num", "-")}: {error}', file=sys.stderr)
+                continue
+            yield record, row
+
+
+class JsonLinesWriter:
+    """
+        It is class that writes records as lines of JSON objects, with field the names
+        of matching conditions are added to every record
+    """
+
+    def __init__(self, output, field=None):
+        self.output = output
+        self.field = field
+
+    def write(self, matches, fields=None):
+        """
+            Writes [(record, original line or row, names of matching conditions)] at once
+        """
+        lines = []
+        for record, original, names in matches:
+            if self.field is not None:
+                lines.append(json.dumps({**record, self.field: names}) + '\n')
+            elif isinstance(original, str):
+                lines.append(original if original.endswith('\n') else original + '\n')
+            else:
+                lines.append(json.dumps(record) + '\n')
+        self.output.write(''.join(lines))
+
+
+class CsvWriter:
+    """
+        It is class that writes records as CSV rows, the header is given by the first input.
+        With field the names of matching conditions are added as a column
+    """
+
+    def __init__(self, output, field=None):
+        self.output = output
+        self.field = field
+        self.writer = None
+
+    def write(self, matches, fields=None):
+        if self.writer is None:
+            fields = list(fields or (matches[0][0] if matches else ()))
+            if self.field is not None:
+                fields.append(self.field)
+            self.writer = csv.DictWriter(self.output, fields, extrasaction='ignore', lineterminator='\n')
+            self.writer.writeheader()
+        if self.field is None:
+            self.writer.writerows(original if isinstance(original, dict) else record
+                                  for record, original, _ in matches)
+        else:
+            self.writer.writerows({**record, self.field: ' '.join(names)} for record, _, names in matches)
+
+
+FORMATS = {'jsonl': (JsonLinesReader, JsonLinesWriter), 'csv': (CsvReader, CsvWriter)}
+
+
+def open_input(path, format):
+    newline = '' if format == 'csv' else None
+    if path == '-':
+        return io.open(sys.stdin.fileno(), encoding='utf-8', buffering=BUFFER_SIZE, newline=newline, closefd=False)
+    return open(path, encoding='utf-8', buffering=BUFFER_SIZE, newline=newline)
+
+
+def guess_format(path):
+    return 'csv' if path.lower().endswith('.csv') else 'jsonl'
+
+
+class GuardedCondition(Condition):
+    """
+        It is class of a condition whose evaluation gives the exception it raises,
+        so a record that can not be evaluated does not stop the worker processes
+    """
+
+    def evaluate(self, names=None, errors=None):
+        try:
+            return super().evaluate(names, errors)
+        except Exception as error:
+            return error
+
+
+def guarded(condition):
+    return GuardedCondition(condition.source, condition.tree, condition.errors, condition.backend, condition.schema)
+
+
+class Matcher:
+    """
+        It is class that gives the names of matching conditions for batches of records,
+        at this process by a RuleSet or at worker processes by a ParallelEvaluator
+    """
+
+    def __init__(self, conditions, workers=0, batch_size=1000):
+        self.names = list(conditions)
+        self.undefined = 0
+        self.evaluator = None
+        if workers:
+            self.evaluator = ParallelEvaluator([guarded(condition) for condition in conditions.values()], workers,
+                                               chunk_size=max(1, batch_size // workers), min_parallel=0)
+        else:
+            self.rule_set = RuleSet(conditions)
+
+    def match(self, records, failures):
+        """
+            Gives the names of matching conditions of every record, a record whose evaluation
+            raises matches nothing and is appended to failures as (position, exception)
+        """
+        matches = []
+        if self.evaluator is not None:
+            for position, values in enumerate(self.evaluator.evaluate(records)):
+                error = next((value for value in values if isinstance(value, Exception)), None)
+                if error is not None:
+                    failures.append((position, error))
+                    values = ()
+                matches.append([name for name, value in zip(self.names, values) if value])
+            return matches
+        errors = []
+        for position, record in enumerate(records):
+            try:
+                matches.append(self.rule_set.match(record, errors))
+            except Exception as error:
+                failures.append((position, error))
+                matches.append([])
+        self.undefined += len(errors)
+        return matches
+
+    def close(self):
+        if self.evaluator is not None:
+            self.evaluator.close()
+
+
+def process(readers, writer, matcher, require_all=False, batch_size=1000):
+    """
+        Matches the records of the readers in batches of batch_size and writes them,
+        records whose evaluation raises are reported to stderr by their numbers and match nothing.
+        Gives the summary {'records', 'written', 'failed', 'matches', 'seconds', 'batches'}
+    """
+    field = writer.field
+    summary = {'records': 0, 'written': 0, 'failed': 0, 'matches': dict.fromkeys(matcher.names, 0),
+               'batches': Statistics()}
+    start = time.perf_counter()
+    for reader in readers:
+        records = reader.records()
+        while True:
+            batch = list(itertools.islice(records, batch_size))
+            if not batch:
+                break
+            begin = time.perf_counter()
+            failures = []
+            matches = matcher.match([record for record, _ in batch], failures)
+            summary['batches'].record(time.perf_counter() - begin)
+            for position, error in failures:
+                print(f'record {summary["records"] + position + 1}: {type(error).__name__}: {error}', file=sys.stderr)
+            summary['failed'] += len(failures)
+            selected = []
+            for (record, original), names in zip(batch, matches):
+                for name in names:
+                    summary['matches'][name] += 1
+                if field is not None or (len(names) == len(matcher.names) if require_all else names):
+                    selected.append((record, original, names))
+            summary['records'] += len(batch)
+            summary['written'] += len(selected)
+            if selected:
+                writer.write(selected, reader.fields)
+    summary['seconds'] = time.perf_counter() - start
+    return summary
+
+
+def report(summary, matcher, batch_size, file=None):
+    """
+        Writes the throughput, latency of batches and counts of matches of every condition
+    """
+    file = file or sys.stderr
+    seconds = summary['seconds']
+    batches = summary['batches']
+    rate = summary['records'] / seconds if seconds else 0
+    # workers do not give back undefined variables
+    undefined = '' if matcher.evaluator is not None else f', undefined variables {matcher.undefined}'
+    print(f'records {summary["records"]}, written {summary["written"]}, failed {summary["failed"]}{undefined}',
+          file=file)
+    print(f'seconds {seconds:.3f}, {rate:.0f} records/s', file=file)
+    if batches.evaluations:
+        print(f'batch of {batch_size} records: mean {batches.seconds / batches.evaluations * 1e3:.3f} ms, '
+              f'p99 {batches.percentile(0.99) * 1e3:.3f} ms', file=file)
+    for name, count in summary['matches'].items():
+        print(f'{count:12} {name}', file=file)
+
+
+def load_conditions(options, schema):
+    """
+        Gives {name: Condition} of the options, a condition with errors or an assignment raises ValueError.
+        Stored conditions are type-checked against the schema too
+    """
+    conditions = {}
+    for text in options.condition:
+        name, text = parse_condition(text)
+        condition = compile(text, schema=schema)
+        if condition.errors or condition.tree is None:
+            raise ValueError(f'Condition {text!r} has syntax errors: {list(condition.errors)}')
+        if isinstance(condition.tree, Assign):
+            raise ValueError(f'Condition {text!r} is an assignment')
+        conditions[name] = condition
+    if options.rules:
+        from syntax_processor_serialize import load
+
+        with load(options.rules) as stored:
+            for name, condition in stored.items():
+                if isinstance(condition.tree, Assign):
+                    raise ValueError(f'Condition {name!r} is an assignment')
+                if schema is not None:
+                    condition = Condition(condition.source, condition.tree, condition.errors, condition.backend, schema)
+                conditions[name] = condition
+    if not conditions:
+        raise ValueError('No conditions, use --condition or --rules')
+    return conditions
+
+
+def main(argv=None):
+    arguments = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arguments.add_argument('inputs', nargs='*', default=['-'], help='JSON Lines or CSV files, "-" is stdin')
+    arguments.add_argument('-c', '--condition', action='append', default=[], help='condition "[name:] text"')
+    arguments.add_argument('--rules', help='file of conditions compiled by syntax_processor_serialize.dump')
+    arguments.add_argument('--format', choices=sorted(FORMATS), help='format of inputs, by default by extension')
+    arguments.add_argument('--schema', help='types of variables "name=int,name=float,name=bool,name=list"')
+    arguments.add_argument('--all', action='store_true', help='write records matching all conditions, not any')
+    arguments.add_argument('--annotate', nargs='?', const='matches', metavar='FIELD',
+                           help='write every record with the names of matching conditions at FIELD')
+    arguments.add_argument('--workers', type=int, default=0,
+                           help='worker processes, 0 evaluates at this one; records are sent to workers, '
+                                'so they pay off only for expensive conditions')
+    arguments.add_argument('--batch-size', type=int, default=1000, help='records read and evaluated at once')
+    arguments.add_argument('--summary', action='store_true', help='write throughput and latency to stderr')
+    options = arguments.parse_args(argv)
+
+    try:
+        schema = parse_schema(options.schema) if options.schema else None
+        conditions = load_conditions(options, schema)
+    except (OSError, ValueError, TypeCheckError) as error:
+        print(error, file=sys.stderr)
+        return 2
+
+    formats = [options.format or guess_format(path) for path in options.inputs]
+    writer = FORMATS[formats[0]][1](sys.stdout, options.annotate)
+    files = []
+    try:
+        readers = []
+        for path, format in zip(options.inputs, formats):
+            files.append(open_input(path, format))
+            readers.append(FORMATS[format][0](files[-1], schema))
+    except OSError as error:
+        for file in files:
+            file.close()
+        print(error, file=sys.stderr)
+        return 2
+    matcher = Matcher(conditions, options.workers, options.batch_size)
+    try:
+        summary = process(readers, writer, matcher, options.all, options.batch_size)
+    finally:
+        sys.stdout.flush()
+        matcher.close()
+        for file in files:
+            file.close()
+    if options.summary:
+        report(summary, matcher, options.batch_size)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
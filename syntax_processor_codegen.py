@@ -0,0 +1,260 @@
+import math
+from collections import Counter
+
+from syntax_processor_functions import call
+from syntax_processor_nodes import LOGICAL, BinOp, Name, left_spine, member
+from syntax_processor_optimizer import repeated_calls, variables, walk
+
+
+MISSING = object()
+
+# operators of a group are written as one chain without parentheses, Python evaluates it from the left,
+# comparisons are not grouped because Python chains them
+GROUPS = {'+': 1, '-': 1, '*': 2, '/': 2, 'and': 3, 'or': 4}
+# Python compiles chains by recursion, longer chains are evaluated in parts kept at locals
+CHAIN_LENGTH = 100
+
+
+def undefined(errors, name):
+    errors.append(('undefined', name))
+    return 0
+
+
+def store(memo, slot, value):
+    memo[slot] = value
+    return value
+
+
+class CodeGenerator:
+    """
+        It is class that lowers a tree of nodes to a Python function
+        "(names, errors) -> value" with the same semantics as node.evaluate.
+        Only the code generated from the nodes is executed and the function
+        has no access to builtins, so it does not give users access to eval.
+        With variables {name: slot} a variable is read from the local "_v<slot>",
+        the lines that bind the locals are given by SlotFunction, with lazy=True
+        a variable is looked up to its local at its first read instead. Types {id(node): type}
+        checked against a schema drop conversions and checks the values do not need
+    """
+
+    def __init__(self, variables=None, types=None, lazy=False):
+        self.constants = {}
+        self.variables = variables
+        self.types = types or {}
+        self.temporaries = 0
+        # names of variables read before the generated code on every path, or on some paths
+        self.bound = set() if lazy else None
+        self.maybe = set()
+        self.checked = set()
+        self.reads = Counter()
+
+    def constant(self, value):
+        """
+            Puts a non-literal value to the namespace of the function
+        """
+        name = f'_c{len(self.constants)}'
+        self.constants[name] = value
+        return name
+
+    def generate(self, node):
+        return getattr(self, 'generate_' + type(node).__name__)(node)
+
+    def generate_bool(self, node):
+        # operators give bools, values of variables are converted like without a schema
+        if (self.types.get(id(node)) is bool and not isinstance(node, Name)) or type(node) in LOGICAL:
+            return self.generate(node)
+        return f'_bool({self.generate(node)})'
+
+    def generate_optional(self, node):
+        if node is None:
+            return 'None'
+        return self.generate(node)
+
+    def generate_Number(self, node):
+        # inf and nan have no literals
+        if type(node.value) in (int, bool) or type(node.value) is float and math.isfinite(node.value):
+            return repr(node.value)
+        return self.constant(node.value)
+
+    def generate_Name(self, node):
+        if self.variables is None:
+            return self.lookup(node.name)
+        local = f'_v{self.variables[node.name]}'
+        if self.bound is None or node.name in self.bound:
+            return local
+        if self.reads[node.name] == 1:
+            # a variable read once is not kept
+            return self.lookup(node.name)
+        self.bound.add(node.name)
+        if node.name in self.maybe:
+            self.checked.add(local)
+            return f'({local} if {local} is not _missing else ({local} := {self.lookup(node.name)}))'
+        return f'({local} := {self.lookup(node.name)})'
+
+    def lookup(self, name):
+        name = repr(name)
+        return f'(names[{name}] if {name} in names else _undefined(errors, {name}))'
+
+    def generate_branch(self, generate, node):
+        """
+            Generates code of the node that may be not evaluated, so variables it reads
+            lazily are read again by checked code after it
+        """
+        if self.bound is None:
+            return generate(node)
+        bound = set(self.bound)
+        code = generate(node)
+        self.maybe |= self.bound - bound
+        self.bound = bound
+        return code
+
+    def generate_chain(self, node, kinds, generate, conditional=False):
+        """
+            Generates the chain of the left operands of kinds without recursion,
+            so long chains like "a + b + c" do not nest parentheses.
+            Right operands of conditional chains may be not evaluated
+        """
+        first, links = left_spine(node.left, kinds)
+        links.append(node)
+        text = generate(first)
+        previous = None
+        parts = []
+        temporary = f'_t{self.temporaries}'
+        if len(links) > CHAIN_LENGTH:
+            self.temporaries += 1
+        for number, link in enumerate(links, 1):
+            operator = link.op if isinstance(link, BinOp) else type(link).__name__.lower()
+            group = GROUPS.get(operator, 0)
+            if previous is not None and (group == 0 or group != previous):
+                text = f'({text})'
+            right = self.generate_branch(generate, link.right) if conditional else generate(link.right)
+            text = f'{text} {operator} {right}'
+            previous = group
+            if number % CHAIN_LENGTH == 0 and number < len(links):
+                parts.append(f'({temporary} := {text})')
+                text = temporary
+                previous = None
+        if parts:
+            return '(' + ', '.join([*parts, text]) + ')[-1]'
+        return f'({text})'
+
+    def generate_BinOp(self, node):
+        return self.generate_chain(node, (BinOp,), self.generate)
+
+    def generate_And(self, node):
+        return self.generate_chain(node, LOGICAL, self.generate_bool, True)
+
+    generate_Or = generate_And
+
+    def generate_AdaptiveAnd(self, node):
+        if self.variables is not None:
+            # the adaptive node reads names, the chain is generated in its order at compile time,
+            # compile() does not reorder chains for slots
+            operator = ' or ' if node.short_circuit else ' and '
+            operands = [self.generate_bool(node.order[0][0])]
+            operands += [self.generate_branch(self.generate_bool, entry[0]) for entry in node.order[1:]]
+            return '(' + operator.join(operands) + ')'
+        return f'{self.constant(node)}.evaluate(names, errors)'
+
+    generate_AdaptiveOr = generate_AdaptiveAnd
+
+    def generate_Not(self, node):
+        return f'(not {self.generate(node.operand)})'
+
+    def generate_Negate(self, node):
+        return f'(-{self.generate(node.operand)})'
+
+    def generate_ArgList(self, node):
+        return '[' + ', '.join(self.generate(item) for item in node.items) + ']'
+
+    def generate_In(self, node):
+        return f'({self.generate(node.expr)} in {self.generate_optional(node.arglist)})'
+
+    def generate_InSet(self, node):
+        if self.types.get(id(node.expr)) in (bool, int, float):
+            # numbers can be hashed, so the lookup can not fail
+            return f'({self.generate(node.expr)} in {self.constant(node.values)})'
+        return f'_member({self.generate(node.expr)}, {self.constant(node.values)})'
+
+    def generate_Call(self, node):
+        return f'_call({node.name!r}, {self.generate_optional(node.arglist)})'
+
+    def generate_statement(self, node):
+        if type(node).__name__ == 'Assign':
+            return f'names[{node.name!r}] = {self.generate(node.expr)}'
+        return f'return {self.generate(node)}'
+
+    def build(self, name, lines, arguments='names, errors'):
+        """
+            Compiles the function "name(arguments)" with the body lines
+        """
+        source = f'def {name}({arguments}):\n' + ''.join(f'    {line}\n' for line in lines)
+        namespace = {'__builtins__': {}, '_undefined': undefined, '_store': store, '_member': member,
+                     '_call': call, '_bool': bool, '_missing': MISSING, **self.constants}
+        exec(compile(source, f'<{name}>', 'exec'), namespace)
+        return namespace[name]
+
+    def function(self, node, lines=(), arguments='names, errors'):
+        if self.bound is not None:
+            self.reads = Counter(child.name for child in walk(node) if isinstance(child, Name))
+        statement = self.generate_statement(node)
+        lines = [*lines, *(f'{local} = _missing' for local in sorted(self.checked))]
+        return self.build('condition', [*lines, statement], arguments)
+
+
+class SharedCodeGenerator(CodeGenerator):
+    """
+        It is class that generates code where every node from slots is kept at a local variable,
+        or at the list "memo" shared by several functions, and evaluated at most once per call
+    """
+
+    def __init__(self, slots, memo=False, variables=None, types=None, lazy=False):
+        super().__init__(variables, types, lazy)
+        self.slots = slots
+        self.memo = memo
+
+    def generate(self, node):
+        code = super().generate(node)
+        slot = self.slots.get(id(node))
+        if slot is None:
+            return code
+        if self.memo:
+            return f'(memo[{slot}] if memo[{slot}] is not _missing else _store(memo, {slot}, {code}))'
+        return f'(_s{slot} if _s{slot} is not _missing else (_s{slot} := {code}))'
+
+
+def generate_function(node, variables=None, lines=(), arguments='names, errors', types=None, lazy=False):
+    """
+        Lowers the tree of nodes to a Python function "(names, errors) -> value",
+        repeated calls of pure functions with the same arguments are evaluated once per call.
+        With variables {name: slot} variables are read from locals bound by the lines,
+        or with lazy=True from names at their first read. Types {id(node): type} choose code
+        for values of known types
+    """
+    slots = repeated_calls(node)
+    if not slots:
+        return CodeGenerator(variables, types, lazy).function(node, lines, arguments)
+    generator = SharedCodeGenerator(slots, variables=variables, types=types, lazy=lazy)
+    lines = [*lines, *(f'_s{slot} = _missing' for slot in sorted(set(slots.values())))]
+    return generator.function(node, lines, arguments)
+
+
+class SlotFunction:
+    """
+        It is class of a tree lowered to code that reads variables by slots resolved at compile time.
+        function(names, errors) looks a variable up to a local at its first read, so it is looked up
+        at most once per evaluation and variables skipped by short circuits are not looked up.
+        A missing variable is appended to errors once and reads as 0. evaluate(values, names, errors)
+        takes a tuple of values of all variables bound by bind(names, errors)
+    """
+
+    def __init__(self, node, types=None):
+        self.variables = tuple(sorted(variables(node)))
+        self.slots = {name: slot for slot, name in enumerate(self.variables)}
+        generator = CodeGenerator()
+        lookups = [generator.generate_Name(Name(name)) for name in self.variables]
+        targets = ''.join(f'_v{slot}, ' for slot in self.slots.values())
+        self.bind = generator.build('bind', ['return (' + ''.join(f'{lookup}, ' for lookup in lookups) + ')'])
+        self.function = generate_function(node, self.slots, types=types, lazy=True)
+        self.evaluate = generate_function(node, self.slots, [f'{targets}= values'] if targets else [],
+                                          'values, names, errors', types)
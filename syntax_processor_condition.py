@@ -0,0 +1,166 @@
+from syntax_processor_codegen import SlotFunction, generate_function
+from syntax_processor_nodes import Number, memoized
+from syntax_processor_optimizer import freeze, repeated_calls, reorder as reorder_tree, simplify, unparse
+from syntax_processor_types import check, normalize_schema
+
+
+class Context:
+    """
+        It is class that keeps variables and errors of one evaluation,
+        a condition can be evaluated with many contexts at many threads at once
+    """
+    __slots__ = ('names', 'errors')
+
+    def __init__(self, names=None):
+        self.names = {} if names is None else names
+        self.errors = []
+
+    def evaluate(self, condition):
+        return condition.evaluate(self.names, self.errors)
+
+
+class Condition:
+    """
+        It is class that keeps a compiled condition to evaluate it many times
+        without lexing and parsing the text again. The condition is immutable, so one
+        instance can be shared by threads. Adaptive nodes of reorder=True keep statistics
+        of evaluations to order their operands, threads updating them at once can lose counts.
+        The backend 'slots' reads variables from a tuple bound once per evaluation.
+        With a schema {name: type} the tree is type-checked once, TypeCheckError is raised
+        for a condition that can not be evaluated, the code backends use the types
+    """
+
+    backends = ('tree', 'code', 'slots')
+
+    def __init__(self, source, tree, errors, backend='tree', schema=None):
+        if backend not in self.backends:
+            raise ValueError(f'Unknown backend {backend!r}')
+        set_attribute = super().__setattr__
+        set_attribute('source', source)
+        set_attribute('tree', tree)
+        set_attribute('errors', tuple(errors))
+        set_attribute('backend', backend)
+        set_attribute('schema', None if schema is None else normalize_schema(schema))
+        self.prepare()
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f'Condition is immutable, can not set {name!r}')
+
+    def __delattr__(self, name):
+        raise AttributeError(f'Condition is immutable, can not delete {name!r}')
+
+    def prepare(self):
+        """
+            Sets the types of the nodes and the functions that are not kept by pickle
+        """
+        types = None
+        if self.schema is not None and self.tree is not None:
+            types = check(self.tree, self.schema, self.source)
+        slots = None
+        if self.backend == 'slots' and self.tree is not None:
+            slots = SlotFunction(self.tree, types)
+        self.__dict__['types'] = types
+        self.__dict__['slots'] = slots
+        self.__dict__['function'] = self.lower()
+
+    def lower(self):
+        if self.tree is None:
+            return None
+        if self.backend == 'code':
+            return generate_function(self.tree, types=self.types)
+        if self.backend == 'slots':
+            return self.slots.function
+        slots = repeated_calls(self.tree)
+        if slots:
+            return memoized(self.tree, slots)
+        return self.tree.evaluate
+
+    # generated functions can not be pickled, they are generated again from the tree
+    def __getstate__(self):
+        return {key: value for key, value in self.__dict__.items() if key not in ('function', 'slots', 'types')}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.__dict__.setdefault('schema', None)
+        self.prepare()
+
+    def evaluate(self, names=None, errors=None):
+        """
+            Evaluates the condition with variables from names,
+            undefined variables are appended to errors as ('undefined', name)
+        """
+        if self.tree is None:
+            return None
+        if names is None:
+            names = {}
+        if errors is None:
+            errors = []
+        return self.function(names, errors)
+
+    @property
+    def variables(self):
+        """
+            Gives the names of variables at the order of their slots, it needs the backend 'slots'
+        """
+        return self.slot_function().variables
+
+    def slot_function(self):
+        if self.backend != 'slots':
+            raise ValueError(f'Condition {self.source!r} is not compiled by the backend \'slots\'')
+        return self.slots or SlotFunction(Number(0))
+
+    def bind(self, names, errors=None):
+        """
+            Gives the tuple of values of self.variables from names,
+            missing variables are appended to errors once and read as 0
+        """
+        return self.slot_function().bind(names, [] if errors is None else errors)
+
+    def evaluate_values(self, values, errors=None, names=None):
+        """
+            Evaluates the condition with the tuple of values of self.variables,
+            a record is bound once and evaluated by many conditions with the same variables.
+            Assignments are written to names
+        """
+        slots = self.slot_function()
+        if self.tree is None:
+            return None
+        return slots.evaluate(values, {} if names is None else names, [] if errors is None else errors)
+
+    @property
+    def simplified(self):
+        """
+            Gives the text of the compiled tree after constant folding and simplification
+        """
+        return unparse(self.tree)
+
+    def __repr__(self):
+        return f'Condition({self.source!r})'
+
+
+def compile(text, backend='tree', reorder=False, lexer=None, schema=None):
+    """
+        Lexes and parses the text once to a Condition,
+        lexer and syntax errors are kept at condition.errors.
+        Constant subtrees are folded and constant lists of "in" are frozen to sets.
+        The backend 'tree' walks the nodes, 'code' lowers them to a Python function.
+        With reorder=True chains of "and"/"or" evaluate their cheapest
+        and most selective operands first, the backend 'slots' generates chains in the written
+        order, so reorder=True with it raises ValueError. The lexer is a class with the interface of ProcessorLexer,
+        ProcessorScanner tokenizes long texts faster.
+        The parser is imported at the first call, so conditions that are only unpickled
+        never build the grammar. With a schema {name: int, float, bool or list} the condition
+        is type-checked, TypeCheckError is raised for types that can not be evaluated
+    """
+    if reorder and backend == 'slots':
+        raise ValueError('Backend \'slots\' generates chains in the written order, '
+                         'reorder=True needs \'tree\' or \'code\'')
+    from syntax_processor_lexer import ProcessorLexer
+    from syntax_processor_parser import ProcessorParser
+
+    lexer = (lexer or ProcessorLexer)()
+    parser = ProcessorParser()
+    tree = freeze(simplify(parser.parse_tree(lexer.tokenize(text))))
+    if reorder:
+        tree = reorder_tree(tree)
+    return Condition(text, tree, lexer.errors + parser.errors, backend, schema)
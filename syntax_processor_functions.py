@@ -0,0 +1,73 @@
+class Function:
+    """
+        It is class of a function callable from conditions as "name(arglist)".
+        A pure function gives the same result for the same arguments and has no side effects,
+        so its calls on constants are folded at compile time and repeated calls are
+        evaluated once per evaluation
+    """
+
+    def __init__(self, name, function, pure=True):
+        self.name = name
+        self.function = function
+        self.pure = pure
+
+    def __call__(self, *args):
+        return self.function(*args)
+
+    def __repr__(self):
+        return f'Function({self.name!r}, pure={self.pure})'
+
+
+def spread(args):
+    """
+        Gives the only argument when it is a list, otherwise all arguments
+    """
+    if len(args) == 1 and isinstance(args[0], (list, tuple, set, frozenset)):
+        return args[0]
+    return args
+
+
+class FunctionRegistry:
+    """
+        It is class that keeps functions by their names
+    """
+
+    def __init__(self):
+        self.functions = {}
+
+    def register(self, name, function=None, pure=True):
+        """
+            Registers the function, without function gives a decorator
+        """
+        if function is None:
+            return lambda function: self.register(name, function, pure) or function
+        self.functions[name] = Function(name, function, pure)
+
+    def unregister(self, name):
+        del self.functions[name]
+
+    def get(self, name):
+        return self.functions.get(name)
+
+    def __contains__(self, name):
+        return name in self.functions
+
+
+functions = FunctionRegistry()
+functions.register('min', lambda *args: min(spread(args)))
+functions.register('max', lambda *args: max(spread(args)))
+functions.register('abs', abs)
+functions.register('len', lambda *args: len(spread(args)))
+functions.register('any', lambda *args: any(spread(args)))
+functions.register('all', lambda *args: all(spread(args)))
+
+
+def call(name, args):
+    """
+        Calls the registered function with the list of arguments,
+        a name that is not registered gives (name, args) for the caller to dispatch
+    """
+    function = functions.get(name)
+    if function is None:
+        return (name, args)
+    return function(*(args or ()))
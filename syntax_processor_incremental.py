@@ -0,0 +1,103 @@
+from graphlib import CycleError, TopologicalSorter
+
+from syntax_processor_condition import compile
+from syntax_processor_nodes import Assign
+from syntax_processor_optimizer import variables
+
+
+class IncrementalEvaluator:
+    """
+        It is class that keeps assignments "ID = expr" and named conditions together
+        with the names every one of them reads. update() recomputes only the assignments
+        and conditions downstream of the changed variable, and listeners get
+        (key, old, new) for every condition whose truth value flipped. Reads and errors
+        of assignments are kept by names, of conditions by keys, so a key may equal a name
+    """
+
+    def __init__(self, names=None):
+        self.names = {} if names is None else names
+        self.assignments = {}
+        self.conditions = {}
+        self.reads = {}
+        self.condition_reads = {}
+        self.truth = {}
+        self.errors = {}
+        self.condition_errors = {}
+        self.listeners = []
+        self.order = []
+
+    def assign(self, text):
+        """
+            Adds or replaces the assignment of a derived variable and evaluates it
+        """
+        condition = compile(text)
+        if not isinstance(condition.tree, Assign) or condition.errors:
+            raise ValueError(f'{text!r} is not an assignment')
+        name = condition.tree.name
+        previous = self.assignments.get(name), self.reads.get(name)
+        self.assignments[name] = condition.tree.expr
+        self.reads[name] = variables(condition.tree.expr)
+        try:
+            self.order = list(TopologicalSorter(
+                {target: self.reads[target] & self.assignments.keys() for target in self.assignments}).static_order())
+        except CycleError:
+            self.assignments[name], self.reads[name] = previous
+            if previous[0] is None:
+                del self.assignments[name], self.reads[name]
+            raise ValueError(f'{text!r} makes a cycle of assignments') from None
+        return self.propagate(name, self.evaluate(name, self.assignments[name], self.errors))
+
+    def add_condition(self, key, text):
+        """
+            Adds or replaces the condition and gives its truth value
+        """
+        condition = compile(text)
+        if condition.tree is None or isinstance(condition.tree, Assign) or condition.errors:
+            raise ValueError(f'{text!r} is not a condition')
+        self.conditions[key] = condition.tree
+        self.condition_reads[key] = variables(condition.tree)
+        self.truth[key] = bool(self.evaluate(key, condition.tree, self.condition_errors))
+        return self.truth[key]
+
+    def subscribe(self, listener):
+        """
+            Calls listener(key, old, new) when the truth value of a condition flips
+        """
+        self.listeners.append(listener)
+
+    def update(self, name, value):
+        """
+            Sets the variable and recomputes what depends on it,
+            gives [(key, old, new)] of conditions whose truth value flipped
+        """
+        return self.propagate(name, value)
+
+    def evaluate(self, key, tree, results):
+        """
+            Evaluates the tree and keeps its errors at results[key]
+        """
+        errors = []
+        value = tree.evaluate(self.names, errors)
+        results[key] = errors
+        return value
+
+    def propagate(self, name, value):
+        changed = {name}
+        self.names[name] = value
+        for target in self.order:
+            if target != name and self.reads[target] & changed:
+                value = self.evaluate(target, self.assignments[target], self.errors)
+                if target not in self.names or self.names[target] != value:
+                    changed.add(target)
+                self.names[target] = value
+        flips = []
+        for key, tree in self.conditions.items():
+            if self.condition_reads[key] & changed:
+                truth = bool(self.evaluate(key, tree, self.condition_errors))
+                if truth != self.truth[key]:
+                    flips.append((key, self.truth[key], truth))
+                    self.truth[key] = truth
+        for flip in flips:
+            for listener in self.listeners:
+                listener(*flip)
+        return flips
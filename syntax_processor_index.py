@@ -0,0 +1,92 @@
+from syntax_processor_nodes import And, BinOp, InSet, Name, Number
+from syntax_processor_optimizer import flatten
+from syntax_processor_codegen import MISSING, SharedCodeGenerator
+from syntax_processor_ruleset import RuleSet
+
+
+def indexed_term(node):
+    """
+        Gives (name, values) for the terms "ID == NUMBER", "NUMBER == ID"
+        and "ID in (NUMBER, ...)", otherwise None
+    """
+    if isinstance(node, BinOp) and node.op == '==':
+        if isinstance(node.left, Name) and isinstance(node.right, Number):
+            return node.left.name, {node.right.value}
+        if isinstance(node.left, Number) and isinstance(node.right, Name):
+            return node.right.name, {node.left.value}
+    if isinstance(node, InSet) and isinstance(node.expr, Name):
+        return node.expr.name, node.values
+    return None
+
+
+def choose_term(tree):
+    """
+        Gives the indexed term of the top-level conjunction that allows the fewest values
+    """
+    terms = [term for term in map(indexed_term, flatten(tree, And)) if term is not None]
+    if not terms:
+        return None
+    return min(terms, key=lambda term: len(term[1]))
+
+
+class IndexedRuleSet(RuleSet):
+    """
+        It is class of a rule set that keeps hash indexes from (variable, constant)
+        to rules whose conjunctions require the variable to equal the constant,
+        so match() evaluates only rules whose indexed terms are satisfied
+    """
+
+    def compile(self):
+        slots = {id(node): slot for slot, node in enumerate(self.shared())}
+        generator = SharedCodeGenerator(slots, memo=True, types=self.node_types())
+        functions = []
+        index = {}
+        unindexed = []
+        for rule_id, tree in self.rules.items():
+            if tree is None:
+                continue
+            position = len(functions)
+            function = generator.build('rule', [f'return {generator.generate(tree)}'], 'names, errors, memo')
+            functions.append((rule_id, function))
+            term = choose_term(tree)
+            if term is None:
+                unindexed.append(position)
+                continue
+            name, values = term
+            table = index.setdefault(name, {})
+            for value in values:
+                table.setdefault(value, []).append(position)
+        self.index = index
+        self.unindexed = unindexed
+        size = len(slots)
+
+        def match(names, errors):
+            memo = [MISSING] * size
+            matches = []
+            for position in sorted(self.candidates(names)):
+                rule_id, function = functions[position]
+                if function(names, errors, memo):
+                    matches.append(rule_id)
+            return matches
+        return match
+
+    def candidates(self, names):
+        """
+            Gives positions of rules that can be true for the variables from names,
+            an undefined variable evaluates to 0
+        """
+        if self.function is None:
+            self.function = self.compile()
+        candidates = set(self.unindexed)
+        for name, table in self.index.items():
+            try:
+                value = names[name]
+            except LookupError:
+                value = 0
+            try:
+                positions = table.get(value)
+            except TypeError:
+                continue
+            if positions:
+                candidates.update(positions)
+        return candidates
@@ -18,11 +18,13 @@ class ProcessorLexer(Lexer):
     ignore = ' \t'
 
     # Regular expression rules for tokens
-    AND     = r'and'
-    NOT     = r'not'
-    OR      = r'or'
-    IN      = r'in'
     ID      = r'[a-zA-Z_][a-zA-Z0-9_@]*'
+
+    # Keywords are lexed as identifiers and remapped, so "index" or "order" stay identifiers
+    ID['and'] = AND
+    ID['not'] = NOT
+    ID['or']  = OR
+    ID['in']  = IN
     EQ      = r'=='
     NE      = r'!='
     GE      = r'>='
@@ -0,0 +1,274 @@
+import threading
+import time
+from collections import Counter, deque
+
+from syntax_processor_condition import Condition, compile
+from syntax_processor_nodes import And, Or
+from syntax_processor_optimizer import rebuild, unparse
+
+
+LATENCY_SAMPLES = 1024
+ERROR_KINDS = ('undefined', 'parse', 'lexer', 'exception')
+
+
+def error_kind(error):
+    """
+        Tells the kind of an error of a condition: lexers append characters, parsers append tokens,
+        evaluations append ('undefined', name) or raise exceptions
+    """
+    if isinstance(error, str):
+        return 'lexer'
+    if isinstance(error, tuple) and error[:1] == ('undefined',):
+        return 'undefined'
+    if isinstance(error, Exception):
+        return 'exception'
+    return 'parse'
+
+
+class Statistics:
+    """
+        It is class that keeps counters of one condition. Latencies of the last
+        LATENCY_SAMPLES evaluations are kept for percentiles. Counters updated
+        by several threads at once can lose counts
+    """
+    __slots__ = ('evaluations', 'seconds', 'latencies', 'branches', 'short_circuits', 'errors')
+
+    def __init__(self, samples=LATENCY_SAMPLES):
+        self.evaluations = 0
+        self.seconds = 0.0
+        self.latencies = deque(maxlen=samples)
+        self.branches = 0
+        self.short_circuits = 0
+        self.errors = Counter()
+
+    def record(self, seconds, errors=()):
+        self.evaluations += 1
+        self.seconds += seconds
+        self.latencies.append(seconds)
+        for error in errors:
+            self.errors[error_kind(error)] += 1
+
+    def percentile(self, fraction):
+        """
+            Gives the latency that the fraction of the kept evaluations do not exceed
+        """
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))]
+
+    def snapshot(self):
+        return {
+            'evaluations': self.evaluations,
+            'seconds': self.seconds,
+            'p99': self.percentile(0.99),
+            'branches': self.branches,
+            'short_circuits': self.short_circuits,
+            'short_circuit_rate': self.short_circuits / self.branches if self.branches else None,
+            'errors': {kind: self.errors[kind] for kind in ERROR_KINDS},
+        }
+
+
+class CountingAnd(And):
+    """
+        It is class of "and" that counts its evaluations and the ones decided by the left operand
+    """
+    __slots__ = ('statistics',)
+
+    def __init__(self, left, right, statistics=None):
+        super().__init__(left, right)
+        self.statistics = statistics or Statistics()
+
+    def evaluate(self, names, errors):
+        self.statistics.branches += 1
+        if not bool(self.left.evaluate(names, errors)):
+            self.statistics.short_circuits += 1
+            return False
+        return bool(self.right.evaluate(names, errors))
+
+
+class CountingOr(Or):
+    """
+        It is class of "or" that counts its evaluations and the ones decided by the left operand
+    """
+    __slots__ = ('statistics',)
+
+    def __init__(self, left, right, statistics=None):
+        super().__init__(left, right)
+        self.statistics = statistics or Statistics()
+
+    def evaluate(self, names, errors):
+        self.statistics.branches += 1
+        if bool(self.left.evaluate(names, errors)):
+            self.statistics.short_circuits += 1
+            return True
+        return bool(self.right.evaluate(names, errors))
+
+
+def counting(node, statistics):
+    """
+        Makes a copy of the tree whose "and"/"or" count short circuits at statistics,
+        adaptive chains keep the costs of their operands
+    """
+    if node is None:
+        return None
+    node = rebuild(node, lambda child: counting(child, statistics))
+    if type(node) is And:
+        return CountingAnd(node.left, node.right, statistics)
+    if type(node) is Or:
+        return CountingOr(node.left, node.right, statistics)
+    return node
+
+
+class InstrumentedCondition:
+    """
+        It is class of a condition whose evaluations are timed and counted at its statistics.
+        Short circuits are counted by the tree backend, other backends are only timed
+    """
+
+    def __init__(self, name, condition, statistics):
+        self.name = name
+        self.statistics = statistics
+        if condition.backend == 'tree' and condition.tree is not None:
+            condition = Condition(condition.source, counting(condition.tree, statistics), condition.errors,
+                                  schema=condition.schema)
+        self.condition = condition
+        self.source = condition.source
+        self.errors = condition.errors
+
+    def evaluate(self, names=None, errors=None):
+        if errors is None:
+            errors = []
+        start = len(errors)
+        begin = time.perf_counter()
+        try:
+            value = self.condition.evaluate(names, errors)
+        except Exception as error:
+            self.statistics.record(time.perf_counter() - begin, [*errors[start:], error])
+            raise
+        self.statistics.record(time.perf_counter() - begin, errors[start:])
+        return value
+
+    def __repr__(self):
+        return f'InstrumentedCondition({self.name!r}, {self.source!r})'
+
+
+class ProfiledRuleSet:
+    """
+        It is class that matches the rules of a RuleSet one by one to profile every rule.
+        It is slower than RuleSet.match, which evaluates shared subexpressions once
+    """
+
+    def __init__(self, metrics, rule_set):
+        self.rules = {}
+        for rule_id, tree in rule_set.rules.items():
+            condition = Condition(unparse(tree) if tree is not None else '', tree, rule_set.errors.get(rule_id, ()))
+            self.rules[rule_id] = metrics.instrument(rule_id, condition)
+
+    def match(self, names, errors=None):
+        """
+            Gives the list of ids of rules whose conditions are true for the variables from names
+        """
+        if errors is None:
+            errors = []
+        return [rule_id for rule_id, condition in self.rules.items()
+                if condition.condition.tree is not None and condition.evaluate(names, errors)]
+
+    def __len__(self):
+        return len(self.rules)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+class Metrics:
+    """
+        It is class that collects statistics of conditions by their names. Only conditions
+        given to instrument() or compile() are measured, a disabled Metrics gives them back
+        unchanged, so evaluation costs nothing more
+    """
+
+    def __init__(self, enabled=True, samples=LATENCY_SAMPLES):
+        self.enabled = enabled
+        self.samples = samples
+        self.conditions = {}
+        self.lock = threading.Lock()
+
+    def statistics(self, name):
+        """
+            Gives the statistics of the condition, they are created at the first call
+        """
+        statistics = self.conditions.get(name)
+        if statistics is None:
+            with self.lock:
+                statistics = self.conditions.setdefault(name, Statistics(self.samples))
+        return statistics
+
+    def instrument(self, name, condition):
+        """
+            Gives the condition measured at the statistics of the name, lexer and syntax errors
+            of the condition are counted once
+        """
+        if not self.enabled:
+            return condition
+        statistics = self.statistics(name)
+        for error in condition.errors:
+            statistics.errors[error_kind(error)] += 1
+        return InstrumentedCondition(name, condition, statistics)
+
+    def compile(self, name, text, **options):
+        """
+            Compiles the text by syntax_processor_condition.compile and instruments it
+        """
+        return self.instrument(name, compile(text, **options))
+
+    def profile(self, rule_set):
+        """
+            Gives the ProfiledRuleSet of the rules, the disabled Metrics gives the rule set
+        """
+        if not self.enabled:
+            return rule_set
+        return ProfiledRuleSet(self, rule_set)
+
+    def snapshot(self):
+        """
+            Gives the dict {name: statistics} of all measured conditions
+        """
+        return {name: statistics.snapshot() for name, statistics in list(self.conditions.items())}
+
+    def prometheus(self, prefix='condition'):
+        """
+            Gives the statistics at the text format of Prometheus, the condition name is a label
+        """
+        snapshot = self.snapshot()
+        lines = []
+
+        def family(name, kind, description, samples):
+            lines.append(f'# HELP {prefix}_{name} {description}')
+            lines.append(f'# TYPE {prefix}_{name} {kind}')
+            for suffix, labels, value in samples:
+                text = ','.join(f'{key}="{escape(label)}"' for key, label in labels)
+                lines.append(f'{prefix}_{name}{suffix}{{{text}}} {value}')
+
+        family('evaluations_total', 'counter', 'Evaluations of the condition.',
+               [('', [('condition', name)], values['evaluations']) for name, values in snapshot.items()])
+        latencies = []
+        for name, values in snapshot.items():
+            if values['p99'] is not None:
+                latencies.append(('', [('condition', name), ('quantile', '0.99')], values['p99']))
+            latencies.append(('_sum', [('condition', name)], values['seconds']))
+            latencies.append(('_count', [('condition', name)], values['evaluations']))
+        family('latency_seconds', 'summary', 'Latency of evaluations of the condition.', latencies)
+        family('branches_total', 'counter', 'Evaluations of "and"/"or" of the condition.',
+               [('', [('condition', name)], values['branches']) for name, values in snapshot.items()])
+        family('short_circuits_total', 'counter', 'Evaluations of "and"/"or" decided by the left operand.',
+               [('', [('condition', name)], values['short_circuits']) for name, values in snapshot.items()])
+        family('errors_total', 'counter', 'Errors of the condition by kind.',
+               [('', [('condition', name), ('kind', kind)], count)
+                for name, values in snapshot.items() for kind, count in values['errors'].items()])
+        return '\n'.join(lines) + '\n'
+
+    def reset(self):
+        with self.lock:
+            self.conditions.clear()
@@ -0,0 +1,458 @@
+import contextvars
+import operator
+import sys
+import weakref
+from collections.abc import Mapping
+
+from syntax_processor_functions import call
+
+
+BINARY_OPERATORS = {
+    '+': operator.add,
+    '-': operator.sub,
+    '*': operator.mul,
+    '/': operator.truediv,
+    '>': operator.gt,
+    '<': operator.lt,
+    '==': operator.eq,
+    '!=': operator.ne,
+    '>=': operator.ge,
+    '<=': operator.le,
+}
+
+
+class Node:
+    """
+        It is base class of nodes of a compiled condition tree. Nodes keep their fields
+        at __slots__, so a node takes no dict
+    """
+    __slots__ = ()
+    fields = ()
+
+    def evaluate(self, names, errors):
+        raise NotImplementedError
+
+    def children(self):
+        return ()
+
+    def __eq__(self, other):
+        return type(self) is type(other) and all(
+            getattr(self, field) == getattr(other, field) for field in self.fields)
+
+    def __hash__(self):
+        return hash((type(self).__name__, *(getattr(self, field) for field in self.fields)))
+
+    def __repr__(self):
+        values = ', '.join(repr(getattr(self, field)) for field in self.fields)
+        return f'{type(self).__name__}({values})'
+
+
+class Number(Node):
+    __slots__ = ('value', '__weakref__')
+    fields = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def evaluate(self, names, errors):
+        return self.value
+
+
+class Name(Node):
+    __slots__ = ('name',)
+    fields = ('name',)
+
+    def __init__(self, name):
+        self.name = sys.intern(name)
+
+    def evaluate(self, names, errors):
+        try:
+            return names[self.name]
+        except LookupError:
+            errors.append(('undefined', self.name))
+            return 0
+
+
+class BinOp(Node):
+    __slots__ = ('op', 'left', 'right')
+    fields = ('op', 'left', 'right')
+
+    def __init__(self, op, left, right):
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def evaluate(self, names, errors):
+        if type(self.left) is not BinOp:
+            left = self.left.evaluate(names, errors)
+            right = self.right.evaluate(names, errors)
+            return BINARY_OPERATORS[self.op](left, right)
+        # chains like "a + b + c" are evaluated along their left operands without recursion
+        first, links = left_spine(self, (BinOp,))
+        value = first.evaluate(names, errors)
+        for link in links:
+            value = BINARY_OPERATORS[link.op](value, link.right.evaluate(names, errors))
+        return value
+
+    def children(self):
+        return (self.left, self.right)
+
+
+class And(Node):
+    __slots__ = ('left', 'right')
+    fields = ('left', 'right')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def evaluate(self, names, errors):
+        if type(self.left) not in LOGICAL:
+            return bool(self.left.evaluate(names, errors)) and bool(self.right.evaluate(names, errors))
+        return evaluate_logical(self, names, errors)
+
+    def children(self):
+        return (self.left, self.right)
+
+
+class Or(Node):
+    __slots__ = ('left', 'right')
+    fields = ('left', 'right')
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+
+    def evaluate(self, names, errors):
+        if type(self.left) not in LOGICAL:
+            return bool(self.left.evaluate(names, errors)) or bool(self.right.evaluate(names, errors))
+        return evaluate_logical(self, names, errors)
+
+    def children(self):
+        return (self.left, self.right)
+
+
+class Not(Node):
+    __slots__ = ('operand',)
+    fields = ('operand',)
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def evaluate(self, names, errors):
+        return not bool(self.operand.evaluate(names, errors))
+
+    def children(self):
+        return (self.operand,)
+
+
+class Negate(Node):
+    __slots__ = ('operand',)
+    fields = ('operand',)
+
+    def __init__(self, operand):
+        self.operand = operand
+
+    def evaluate(self, names, errors):
+        return -self.operand.evaluate(names, errors)
+
+    def children(self):
+        return (self.operand,)
+
+
+class ArgList(Node):
+    __slots__ = ('items',)
+    fields = ('items',)
+
+    def __init__(self, items):
+        self.items = tuple(items)
+
+    def evaluate(self, names, errors):
+        return [item.evaluate(names, errors) for item in self.items]
+
+    def children(self):
+        return self.items
+
+
+class In(Node):
+    __slots__ = ('expr', 'arglist')
+    fields = ('expr', 'arglist')
+
+    def __init__(self, expr, arglist):
+        self.expr = expr
+        self.arglist = arglist
+
+    def evaluate(self, names, errors):
+        return self.expr.evaluate(names, errors) in evaluate_optional(self.arglist, names, errors)
+
+    def children(self):
+        return (self.expr,) if self.arglist is None else (self.expr, self.arglist)
+
+
+class InSet(Node):
+    """
+        It is class of "expr in (NUMBER, ...)" with the constant list frozen to a set,
+        values that can not be hashed are looked up like at the list
+    """
+    __slots__ = ('expr', 'values')
+    fields = ('expr', 'values')
+
+    def __init__(self, expr, values):
+        self.expr = expr
+        self.values = frozenset(values)
+
+    def evaluate(self, names, errors):
+        return member(self.expr.evaluate(names, errors), self.values)
+
+    def children(self):
+        return (self.expr,)
+
+
+class AdaptiveAnd(Node):
+    """
+        It is class of a chain of "and" operands that are evaluated in the order
+        of the lowest expected cost, the order is recomputed from the observed
+        results every reorder_interval evaluations. Operands that can raise keep
+        their written position and no operand is moved past them, so a guard
+        like "b != 0 and a / b > 1" stays before the division
+    """
+    __slots__ = ('operands', 'order', 'countdown')
+    fields = ('operands',)
+    reorder_interval = 256
+    short_circuit = False
+
+    def __init__(self, operands, costs=None):
+        self.operands = tuple(operands)
+        if costs is None:
+            costs = [1] * len(self.operands)
+        # [operand, cost, evaluations, short circuits, fixed] for every operand, in evaluation order
+        self.order = [[operand, cost, 0, 0, can_raise(operand)] for operand, cost in zip(self.operands, costs)]
+        self.countdown = self.reorder_interval
+
+    def evaluate(self, names, errors):
+        self.countdown -= 1
+        # threads can decrement it at once past zero
+        if self.countdown <= 0:
+            self.reorder()
+        for entry in self.order:
+            entry[2] += 1
+            if bool(entry[0].evaluate(names, errors)) is self.short_circuit:
+                entry[3] += 1
+                return self.short_circuit
+        return not self.short_circuit
+
+    def reorder(self):
+        """
+            Sorts the operands between fixed ones by cost divided by the probability to short
+            circuit the chain. The sorted list replaces self.order at once, threads iterating
+            the old list are not affected, counters updated by several threads at once can only lose counts
+        """
+        self.countdown = self.reorder_interval
+        order = []
+        run = []
+        for entry in self.order:
+            if entry[4]:
+                order += sorted(run, key=expected_cost)
+                order.append(entry)
+                run = []
+            else:
+                run.append(entry)
+        self.order = order + sorted(run, key=expected_cost)
+
+    def children(self):
+        return self.operands
+
+
+class AdaptiveOr(AdaptiveAnd):
+    """
+        It is class of a chain of "or" operands that are evaluated in the order
+        of the lowest expected cost
+    """
+    __slots__ = ()
+    short_circuit = True
+
+
+class Assign(Node):
+    __slots__ = ('name', 'expr')
+    fields = ('name', 'expr')
+
+    def __init__(self, name, expr):
+        self.name = sys.intern(name)
+        self.expr = expr
+
+    def evaluate(self, names, errors):
+        names[self.name] = self.expr.evaluate(names, errors)
+
+    def children(self):
+        return (self.expr,)
+
+
+# (slots {id(call): slot}, values {slot: value}) of the evaluation of a tree with repeated pure calls
+CALLS = contextvars.ContextVar('calls', default=None)
+
+
+class Call(Node):
+    """
+        It is class of a call of a registered function. Repeated pure calls of a tree
+        evaluated by memoized() are called once per evaluation
+    """
+    __slots__ = ('name', 'arglist')
+    fields = ('name', 'arglist')
+
+    def __init__(self, name, arglist):
+        self.name = sys.intern(name)
+        self.arglist = arglist
+
+    def evaluate(self, names, errors):
+        memo = CALLS.get()
+        if memo is None or id(self) not in memo[0]:
+            return call(self.name, evaluate_optional(self.arglist, names, errors))
+        slot = memo[0][id(self)]
+        values = memo[1]
+        if slot not in values:
+            values[slot] = call(self.name, evaluate_optional(self.arglist, names, errors))
+        return values[slot]
+
+    def children(self):
+        return () if self.arglist is None else (self.arglist,)
+
+
+LOGICAL = (And, Or)
+
+
+def left_spine(node, kinds):
+    """
+        Gives the first operand below the left operands of the types kinds and
+        the nodes above it, the lowest first, so chains are walked without recursion
+    """
+    links = []
+    while type(node) in kinds:
+        links.append(node)
+        node = node.left
+    links.reverse()
+    return node, links
+
+
+def evaluate_logical(node, names, errors):
+    """
+        Evaluates chains of "and"/"or" like "a and b and c" along their left operands
+    """
+    first, links = left_spine(node, LOGICAL)
+    value = bool(first.evaluate(names, errors))
+    for link in links:
+        # "and" evaluates the right operand after true, "or" after false
+        if value is (type(link) is And):
+            value = bool(link.right.evaluate(names, errors))
+    return value
+
+
+def expected_cost(entry):
+    return entry[1] * (entry[2] + 2) / (entry[3] + 1)
+
+
+def can_raise(node):
+    """
+        Tells whether the evaluation of the tree can raise, that is it divides or calls functions
+    """
+    if node is None:
+        return False
+    if isinstance(node, Call) or (isinstance(node, BinOp) and node.op == '/'):
+        return True
+    return any(map(can_raise, node.children()))
+
+
+def memoized(tree, slots):
+    """
+        Gives the function "(names, errors) -> value" of the tree that calls the calls of slots
+        {id(call): slot} once per evaluation, equal calls share a slot. The memo is kept
+        by a context variable, so threads and tasks evaluating the tree do not share it
+    """
+    def evaluate(names, errors):
+        token = CALLS.set((slots, {}))
+        try:
+            return tree.evaluate(names, errors)
+        finally:
+            CALLS.reset(token)
+    return evaluate
+
+
+# Number nodes of equal literals are shared while any tree keeps them
+LITERALS = weakref.WeakValueDictionary()
+
+
+def literal(value):
+    """
+        Gives the Number of the value from the pool of literals,
+        values that can not be hashed give a new Number
+    """
+    try:
+        key = (type(value), value)
+        node = LITERALS.get(key)
+    except TypeError:
+        return Number(value)
+    if node is None:
+        node = LITERALS.setdefault(key, Number(value))
+    return node
+
+
+def member(value, values):
+    try:
+        return value in values
+    except TypeError:
+        return any(value == item for item in values)
+
+
+def evaluate_optional(node, names, errors):
+    """
+        Evaluates the node, empty parentheses "()" give no node and evaluate to None
+    """
+    if node is None:
+        return None
+    return node.evaluate(names, errors)
+
+
+def memory_report(*objects):
+    """
+        Reports the bytes taken by trees of Conditions, RuleSets, nodes and mappings or lists of them.
+        Nodes and values shared by several trees, like pooled literals and interned names,
+        are counted once. Gives {'trees', 'nodes', 'node_bytes', 'value_bytes', 'bytes', 'types'},
+        types is {node type: {'count', 'bytes'}}
+    """
+    trees = []
+    objects = list(objects)
+    while objects:
+        item = objects.pop()
+        if isinstance(item, Node):
+            trees.append(item)
+        elif hasattr(item, 'rules'):
+            trees.extend(tree for tree in item.rules.values() if tree is not None)
+        elif hasattr(item, 'tree'):
+            if item.tree is not None:
+                trees.append(item.tree)
+        elif isinstance(item, Mapping):
+            objects.extend(item.values())
+        elif item is not None:
+            objects.extend(item)
+
+    seen = set()
+    types = {}
+    node_bytes = value_bytes = 0
+    nodes = list(trees)
+    while nodes:
+        node = nodes.pop()
+        if id(node) in seen:
+            continue
+        seen.add(id(node))
+        size = sys.getsizeof(node) + (sys.getsizeof(node.__dict__) if hasattr(node, '__dict__') else 0)
+        node_bytes += size
+        counters = types.setdefault(type(node).__name__, {'count': 0, 'bytes': 0})
+        counters['count'] += 1
+        counters['bytes'] += size
+        for field in node.fields:
+            value = getattr(node, field)
+            if not isinstance(value, Node) and id(value) not in seen:
+                seen.add(id(value))
+                value_bytes += sys.getsizeof(value)
+        nodes.extend(node.children())
+    return {'trees': len(trees), 'nodes': sum(counters['count'] for counters in types.values()),
+            'node_bytes': node_bytes, 'value_bytes': value_bytes, 'bytes': node_bytes + value_bytes, 'types': types}
@@ -0,0 +1,284 @@
+import operator
+from collections import Counter
+
+from syntax_processor_functions import functions
+from syntax_processor_nodes import (LOGICAL, AdaptiveAnd, AdaptiveOr, And, ArgList, Assign, BinOp, Call, In, InSet,
+                                    Name, Negate, Node, Not, Number, Or, left_spine, literal)
+
+
+COMPARISONS = {'>', '<', '==', '!=', '>=', '<='}
+
+
+def arguments(node):
+    """
+        Gives the values of the node for its constructor, adaptive chains give their operands and costs
+    """
+    if isinstance(node, AdaptiveAnd):
+        costs = {id(entry[0]): entry[1] for entry in node.order}
+        return (node.operands, [costs[id(operand)] for operand in node.operands])
+    return tuple(getattr(node, field) for field in node.fields)
+
+
+def rebuild(node, function):
+    """
+        Makes a copy of the node with function applied to every child node,
+        the node itself is given when no child is changed, so pooled literals stay shared
+    """
+    values = []
+    changed = False
+    for old in arguments(node):
+        value = old
+        if isinstance(value, Node):
+            value = function(value)
+            changed = changed or value is not old
+        elif isinstance(value, tuple):
+            value = tuple(function(item) if isinstance(item, Node) else item for item in value)
+            changed = changed or any(map(operator.is_not, value, old))
+        values.append(value)
+    return type(node)(*values) if changed else node
+
+
+def cost(node):
+    """
+        Estimates the cost to evaluate the node as the number of nodes, a variable costs two
+    """
+    return sum(2 if isinstance(child, Name) else 1 for child in walk(node))
+
+
+def walk(node):
+    """
+        Gives all nodes of the tree, parents before children
+    """
+    nodes = [] if node is None else [node]
+    while nodes:
+        node = nodes.pop()
+        yield node
+        nodes.extend(reversed(node.children()))
+
+
+def variables(node):
+    """
+        Gives the set of names of variables read by the tree
+    """
+    return {child.name for child in walk(node) if isinstance(child, Name)}
+
+
+def transform(node, function):
+    """
+        Applies function to every node after its children without recursion, the node given
+        to function is rebuilt from the results of its children, so deep trees are transformed
+    """
+    if node is None:
+        return None
+    results = {}
+    nodes = [(node, False)]
+    while nodes:
+        node, ready = nodes.pop()
+        if ready:
+            results[id(node)] = function(rebuild(node, lambda child: results[id(child)]))
+        elif id(node) not in results:
+            nodes.append((node, True))
+            nodes.extend((child, False) for child in node.children())
+    return results[id(node)]
+
+
+def flatten(node, kind):
+    """
+        Gives the operands of the chain of kind in the written order
+    """
+    operands = []
+    nodes = [node]
+    while nodes:
+        node = nodes.pop()
+        if isinstance(node, kind):
+            nodes += [node.right, node.left]
+        else:
+            operands.append(node)
+    return operands
+
+
+def is_boolean(node):
+    """
+        Tells whether the node always evaluates to a bool
+    """
+    if isinstance(node, BinOp):
+        return node.op in COMPARISONS
+    if isinstance(node, Number):
+        return type(node.value) is bool
+    return isinstance(node, (And, Or, Not, In, InSet, AdaptiveAnd))
+
+
+def is_pure(node):
+    """
+        Tells whether the tree calls no impure registered functions
+    """
+    for child in walk(node):
+        if isinstance(child, Call):
+            function = functions.get(child.name)
+            if function is not None and not function.pure:
+                return False
+    return True
+
+
+def repeated_calls(node):
+    """
+        Gives {id(call): slot} of calls of pure registered functions that are repeated in the tree,
+        equal calls share a slot, so they can be evaluated once per evaluation
+    """
+    calls = [call for call in walk(node)
+             if isinstance(call, Call) and call.name in functions and is_pure(call)]
+    counts = Counter(calls)
+    shared = {}
+    return {id(call): shared.setdefault(call, len(shared)) for call in calls if counts[call] > 1}
+
+
+def as_bool(node, boolean):
+    """
+        Gives a node evaluating to bool(node), or to a value of the same truth when boolean is True
+    """
+    if boolean or is_boolean(node):
+        return node
+    return Not(Not(node))
+
+
+def is_constant(node):
+    if isinstance(node, ArgList):
+        return all(isinstance(item, Number) for item in node.items)
+    return isinstance(node, Number)
+
+
+def fold(node):
+    """
+        Replaces the node without variables by its value,
+        the node is kept when the evaluation fails, so the error happens at evaluation
+    """
+    try:
+        return literal(node.evaluate({}, []))
+    except Exception:
+        return node
+
+
+def simplify(node, boolean=False):
+    """
+        Folds constant subtrees, removes double negation and collapses "True and e",
+        "False or e", "e and True", "e or False". Operands that are evaluated keep
+        their undefined variables and errors, so "e and False" is not folded.
+        When boolean is True only the truth of the result is kept
+    """
+    if node is None:
+        return None
+    # chains like "a and b and c" or "a + b + c" are simplified along their left operands without recursion
+    if isinstance(node, (And, Or)):
+        first, links = left_spine(node.left, LOGICAL)
+        links.append(node)
+        node = simplify(first, True)
+        for link in links:
+            node = simplify_logical(link, node, boolean if link is links[-1] else True)
+        return node
+    if isinstance(node, BinOp):
+        first, links = left_spine(node.left, (BinOp,))
+        links.append(node)
+        node = simplify(first)
+        for link in links:
+            right = simplify(link.right)
+            if node is not link.left or right is not link.right:
+                link = BinOp(link.op, node, right)
+            node = fold(link) if is_constant(link.left) and is_constant(link.right) else link
+        return node
+    if isinstance(node, Not):
+        operand = simplify(node.operand, True)
+        if isinstance(operand, Number):
+            return literal(not operand.value)
+        if isinstance(operand, Not):
+            return as_bool(operand.operand, boolean)
+        return Not(operand)
+    node = rebuild(node, simplify)
+    if isinstance(node, (Negate, In, InSet)) and all(map(is_constant, node.children())):
+        return fold(node)
+    if isinstance(node, Call) and node.name in functions and is_pure(node) and all(map(is_constant, node.children())):
+        return fold(node)
+    return node
+
+
+def simplify_logical(node, left, boolean):
+    """
+        Simplifies the "and"/"or" node with its left operand simplified
+    """
+    right = simplify(node.right, True)
+    decisive = isinstance(node, Or)
+    if isinstance(left, Number):
+        if bool(left.value) is decisive:
+            return literal(decisive)
+        return as_bool(right, boolean)
+    if isinstance(right, Number) and bool(right.value) is not decisive:
+        return as_bool(left, boolean)
+    return type(node)(left, right)
+
+
+def unparse(node):
+    """
+        Gives the text of the tree with every operation in parentheses,
+        folded booleans and floats are written as Python literals
+    """
+    if node is None:
+        return ''
+    if isinstance(node, Number):
+        return repr(node.value)
+    if isinstance(node, Name):
+        return node.name
+    if isinstance(node, (BinOp, And, Or)):
+        first, links = left_spine(node.left, (BinOp, And, Or))
+        links.append(node)
+        text = unparse(first)
+        for link in links:
+            operator = link.op if isinstance(link, BinOp) else 'or' if isinstance(link, Or) else 'and'
+            text = f'({text} {operator} {unparse(link.right)})'
+        return text
+    if isinstance(node, AdaptiveAnd):
+        operator = ' or ' if isinstance(node, AdaptiveOr) else ' and '
+        return '(' + operator.join(unparse(operand) for operand in node.operands) + ')'
+    if isinstance(node, Not):
+        return f'(not {unparse(node.operand)})'
+    if isinstance(node, Negate):
+        return f'(-{unparse(node.operand)})'
+    if isinstance(node, ArgList):
+        return ', '.join(unparse(item) for item in node.items)
+    if isinstance(node, In):
+        return f'({unparse(node.expr)} in ({unparse(node.arglist)}))'
+    if isinstance(node, InSet):
+        return f'({unparse(node.expr)} in ({", ".join(repr(value) for value in sorted(node.values))}))'
+    if isinstance(node, Call):
+        return f'{node.name}({unparse(node.arglist)})'
+    if isinstance(node, Assign):
+        return f'{node.name} = {unparse(node.expr)}'
+    raise TypeError(f'Unknown node {node!r}')
+
+
+def freeze(node):
+    """
+        Replaces "expr in (NUMBER, ...)" with a lookup at a set of the numbers
+    """
+    return transform(node, freeze_node)
+
+
+def freeze_node(node):
+    if (isinstance(node, In) and isinstance(node.arglist, ArgList)
+            and all(isinstance(item, Number) for item in node.arglist.items)):
+        return InSet(node.expr, [item.value for item in node.arglist.items])
+    return node
+
+
+def reorder(node):
+    """
+        Replaces chains of "and"/"or" with adaptive nodes that evaluate the cheapest and
+        most selective operands first. Operands that divide or call functions are not moved
+        and nothing is moved past them. Operands that are not evaluated do not record
+        their undefined variables, so the errors may differ from the written order
+    """
+    if node is None:
+        return None
+    for kind, adaptive in ((And, AdaptiveAnd), (Or, AdaptiveOr)):
+        if isinstance(node, kind):
+            operands = [reorder(operand) for operand in flatten(node, kind)]
+            return adaptive(operands, [cost(operand) for operand in operands])
+    return rebuild(node, reorder)
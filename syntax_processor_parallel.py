@@ -0,0 +1,139 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+from syntax_processor_condition import Condition, compile
+
+
+# conditions of the worker process, they are sent once by the initializer of the pool
+worker_conditions = []
+
+
+def initialize(conditions):
+    worker_conditions[:] = conditions
+
+
+def evaluate_records(records):
+    return [[condition.evaluate(names) for condition in worker_conditions] for names in records]
+
+
+def attach(spec, start, end):
+    import numpy as np
+
+    name, dtype, shape = spec
+    # workers share the resource tracker of the parent process, which unlinks the block
+    block = shared_memory.SharedMemory(name=name)
+    return block, np.ndarray(shape, dtype, buffer=block.buf)[start:end]
+
+
+def evaluate_columns(specs, start, end):
+    import numpy as np
+    from syntax_processor_batch import evaluate_batch
+
+    blocks = []
+    columns = {}
+    column = mask = None
+    try:
+        for name, (data, mask) in specs.items():
+            block, column = attach(data, start, end)
+            blocks.append(block)
+            if mask is not None:
+                block, mask = attach(mask, start, end)
+                blocks.append(block)
+                column = np.ma.MaskedArray(column, mask=mask)
+            columns[name] = column
+        results = []
+        for condition in worker_conditions:
+            result = evaluate_batch(condition, columns, end - start)
+            results.append((result.data.copy(), result.mask.copy()))
+        del columns, column, mask
+        return results
+    finally:
+        for block in blocks:
+            block.close()
+
+
+class ParallelEvaluator:
+    """
+        It is class that evaluates compiled conditions over batches of records at a pool
+        of worker processes. Conditions are sent to every worker once, batches are split
+        to chunks of chunk_size and results are given in the order of the input.
+        Batches shorter than min_parallel are evaluated in this process
+    """
+
+    def __init__(self, conditions, workers=None, chunk_size=10000, min_parallel=None):
+        self.conditions = [condition if isinstance(condition, Condition) else compile(condition)
+                           for condition in conditions]
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.min_parallel = chunk_size if min_parallel is None else min_parallel
+        self.pool = None
+
+    def start(self):
+        if self.pool is None:
+            self.pool = ProcessPoolExecutor(self.workers, initializer=initialize, initargs=(self.conditions,))
+        return self.pool
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def chunks(self, size):
+        return [(start, min(start + self.chunk_size, size)) for start in range(0, size, self.chunk_size)]
+
+    def evaluate(self, records):
+        """
+            Gives for every record {name: value} the list of values of the conditions
+        """
+        records = list(records)
+        if len(records) < self.min_parallel:
+            return [[condition.evaluate(names) for condition in self.conditions] for names in records]
+        pool = self.start()
+        futures = [pool.submit(evaluate_records, records[start:end]) for start, end in self.chunks(len(records))]
+        return [values for future in futures for values in future.result()]
+
+    def evaluate_columns(self, columns, size=None):
+        """
+            Gives for every condition the masked array of evaluate_batch over columns {name: array},
+            the columns are put to shared memory and every worker reads its rows from there
+        """
+        import numpy as np
+        from syntax_processor_batch import evaluate_batch
+
+        if size is None:
+            size = len(next(iter(columns.values()))) if columns else 1
+        if size < self.min_parallel:
+            return [evaluate_batch(condition, columns, size) for condition in self.conditions]
+
+        blocks = []
+
+        def share(array):
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            blocks.append(block)
+            np.ndarray(array.shape, array.dtype, buffer=block.buf)[:] = array
+            return block.name, array.dtype.str, array.shape
+
+        try:
+            specs = {}
+            for name, column in columns.items():
+                mask = np.ma.getmask(column)
+                specs[name] = (share(np.ma.getdata(column)),
+                               None if mask is np.ma.nomask else share(mask))
+            pool = self.start()
+            futures = [pool.submit(evaluate_columns, specs, start, end) for start, end in self.chunks(size)]
+            parts = [future.result() for future in futures]
+        finally:
+            for block in blocks:
+                block.close()
+                block.unlink()
+        return [np.ma.MaskedArray(np.concatenate([part[number][0] for part in parts]),
+                                  mask=np.concatenate([part[number][1] for part in parts]))
+                for number in range(len(self.conditions))]
@@ -2,6 +2,8 @@
 
 from sly import Parser
 from syntax_processor_lexer import ProcessorLexer
+from syntax_processor_nodes import And, ArgList, Assign, BinOp, Call, In, Name, Negate, Not, Or, literal
+from syntax_processor_tables import build
 
 
 class ProcessorParser(Parser):
@@ -19,17 +21,40 @@ class ProcessorParser(Parser):
         ('left', TIMES, DIVIDE),
         ('right', UMINUS))
 
+    @classmethod
+    def _build(cls, definitions):
+        """
+            Builds the grammar, the LALR tables are loaded from the tables file
+            while the grammar does not change
+        """
+        build(cls, definitions)
+
     def __init__(self):
         self.names = {}
         self.errors = []
 
+    def parse(self, tokens):
+        """
+            Parses the tokens and evaluates the statement against self.names
+        """
+        tree = self.parse_tree(tokens)
+        if tree is None:
+            return None
+        return tree.evaluate(self.names, self.errors)
+
+    def parse_tree(self, tokens):
+        """
+            Parses the tokens to a tree of nodes without evaluating it
+        """
+        return super().parse(tokens)
+
     @_('ID ASSIGN expr')
     def statement(self, p):
-        self.names[p.ID] = p.expr
+        return Assign(p.ID, p.expr)
 
     @_('ID "(" [ arglist ] ")"')
-    def statement(self, p):
-        return (p.ID, p.arglist)
+    def expr(self, p):
+        return Call(p.ID, p.arglist)
 
     @_(' arglist ')
     def statement(self, p):
@@ -37,7 +62,7 @@ class ProcessorParser(Parser):
 
     @_('expr IN arglist ')
     def expr(self, p):
-        return p.expr in p.arglist
+        return In(p.expr, p.arglist)
 
     @_('"(" [ arglist ] ")"')       # works also as "def expr (self, p):"
     def arglist(self, p):
@@ -45,7 +70,7 @@ class ProcessorParser(Parser):
 
     @_('expr { COMMA expr }')
     def arglist(self, p):
-        return [p.expr0, *p.expr1]
+        return ArgList([p.expr0, *p.expr1])
 
     @_('expr')
     def statement(self, p):
@@ -57,71 +82,67 @@ class ProcessorParser(Parser):
 
     @_('NUMBER')
     def expr(self, p):
-        return p.NUMBER
+        return literal(p.NUMBER)
 
     @_('expr PLUS expr')
     def expr(self, p):
-        return p.expr0 + p.expr1
+        return BinOp('+', p.expr0, p.expr1)
 
     @_('expr MINUS expr')
     def expr(self, p):
-        return p.expr0 - p.expr1
+        return BinOp('-', p.expr0, p.expr1)
 
     @_('expr TIMES expr')
     def expr(self, p):
-        return p.expr0 * p.expr1
+        return BinOp('*', p.expr0, p.expr1)
 
     @_('expr DIVIDE expr')
     def expr(self, p):
-        return p.expr0 / p.expr1
+        return BinOp('/', p.expr0, p.expr1)
 
     @_('expr GT expr')
     def expr(self, p):
-        return p.expr0 > p.expr1
+        return BinOp('>', p.expr0, p.expr1)
 
     @_('expr LT expr')
     def expr(self, p):
-        return p.expr0 < p.expr1
+        return BinOp('<', p.expr0, p.expr1)
 
     @_('expr EQ expr')
     def expr(self, p):
-        return p.expr0 == p.expr1
+        return BinOp('==', p.expr0, p.expr1)
 
     @_('expr NE expr')
     def expr(self, p):
-        return p.expr0 != p.expr1
+        return BinOp('!=', p.expr0, p.expr1)
 
     @_('expr GE expr')
     def expr(self, p):
-        return p.expr0 >= p.expr1
+        return BinOp('>=', p.expr0, p.expr1)
 
     @_('expr LE expr')
     def expr(self, p):
-        return p.expr0 <= p.expr1
+        return BinOp('<=', p.expr0, p.expr1)
 
     @_('expr AND expr')
     def expr(self, p):
-        return bool(p.expr0) and bool(p.expr1)
+        return And(p.expr0, p.expr1)
 
     @_('expr OR expr')
     def expr(self, p):
-        return bool(p.expr0) or bool(p.expr1)
+        return Or(p.expr0, p.expr1)
 
     @_('NOT expr')
     def expr(self, p):
-        return not bool(p.expr)
+        return Not(p.expr)
 
     @_('MINUS expr %prec UMINUS')
     def expr(self, p):
-        return -p.expr
+        return Negate(p.expr)
 
     @_('ID')
     def expr(self, p):
-        try:
-            return self.names[p.ID]
-        except LookupError:
-            self.errors.append(('undefined', p.ID))
-            return 0
+        return Name(p.ID)
 
     def error(self, tok):
         self.errors.append(tok)
@@ -0,0 +1,125 @@
+from syntax_processor_codegen import SharedCodeGenerator
+from syntax_processor_condition import Condition, compile
+from syntax_processor_nodes import AdaptiveAnd, Assign, Name, Node, Number
+from syntax_processor_optimizer import is_pure, rebuild
+from syntax_processor_types import TypeChecker, check, normalize_schema
+
+
+class RuleSet:
+    """
+        It is class that compiles many conditions together. Equal subexpressions of all rules
+        are merged to one node of a DAG and evaluated once per event by match().
+        With a schema {name: type} every rule is type-checked when it is added
+    """
+
+    def __init__(self, rules=None, schema=None):
+        self.schema = None if schema is None else normalize_schema(schema)
+        self.rules = {}
+        self.errors = {}
+        self.nodes = {}
+        self.function = None
+        for rule_id, text in (rules or {}).items():
+            self.add(rule_id, text)
+
+    def add(self, rule_id, text):
+        """
+            Compiles the condition text of the rule, lexer and syntax errors are kept at self.errors.
+            A compiled Condition is added without parsing. A rule that does not match
+            the schema raises TypeCheckError
+        """
+        condition = text if isinstance(text, Condition) else compile(text, schema=self.schema)
+        if self.schema is not None and condition.schema != self.schema and condition.tree is not None:
+            check(condition.tree, self.schema, condition.source)
+        if condition.errors:
+            self.errors[rule_id] = condition.errors
+        if isinstance(condition.tree, Assign):
+            raise ValueError(f'Rule {rule_id!r} is an assignment, not a condition')
+        self.rules[rule_id] = self.intern(condition.tree)
+        self.function = None
+
+    def remove(self, rule_id):
+        """
+            Removes the rule, the shared nodes are interned again from the remaining rules,
+            so nodes used only by the removed rule are released
+        """
+        del self.rules[rule_id]
+        self.errors.pop(rule_id, None)
+        self.nodes = {}
+        for other_id, tree in self.rules.items():
+            self.rules[other_id] = self.intern(tree)
+        self.function = None
+
+    def intern(self, node):
+        """
+            Gives the single shared node equal to the node, children are interned first
+            so the key compares them by identity. Adaptive chains keep statistics
+            of their own evaluations, so they are not shared between rules
+        """
+        if node is None:
+            return None
+        node = rebuild(node, self.intern)
+        if isinstance(node, AdaptiveAnd):
+            return node
+        key = (type(node),)
+        for field in node.fields:
+            value = getattr(node, field)
+            if isinstance(value, Node):
+                value = id(value)
+            elif isinstance(value, tuple):
+                value = tuple(id(item) if isinstance(item, Node) else item for item in value)
+            key += (value,)
+        return self.nodes.setdefault(key, node)
+
+    def shared(self):
+        """
+            Gives the nodes referenced by more than one parent or rule,
+            variables and numbers are cheaper to evaluate again than to share,
+            calls of impure functions are evaluated every time
+        """
+        references = {}
+        visited = []
+        nodes = [tree for tree in self.rules.values() if tree is not None]
+        while nodes:
+            node = nodes.pop()
+            references[id(node)] = references.get(id(node), 0) + 1
+            if references[id(node)] == 1:
+                visited.append(node)
+                nodes.extend(node.children())
+        return [node for node in visited
+                if references[id(node)] > 1 and not isinstance(node, (Name, Number)) and is_pure(node)]
+
+    def node_types(self):
+        """
+            Gives the types {id(node): type} of the nodes of all rules, None without a schema
+        """
+        if self.schema is None:
+            return None
+        checker = TypeChecker(self.schema)
+        for tree in self.rules.values():
+            checker.check(tree)
+        return checker.types
+
+    def compile(self):
+        slots = {id(node): slot for slot, node in enumerate(self.shared())}
+        generator = SharedCodeGenerator(slots, types=self.node_types())
+        lines = [f'_s{slot} = _missing' for slot in slots.values()]
+        lines.append('matches = []')
+        for rule_id, tree in self.rules.items():
+            if tree is not None:
+                lines.append(f'if {generator.generate(tree)}:')
+                lines.append(f'    matches.append({generator.constant(rule_id)})')
+        lines.append('return matches')
+        return generator.build('match', lines)
+
+    def match(self, names, errors=None):
+        """
+            Gives the list of ids of rules whose conditions are true for the variables from names
+        """
+        if self.function is None:
+            self.function = self.compile()
+        if errors is None:
+            errors = []
+        return self.function(names, errors)
+
+    def __len__(self):
+        return len(self.rules)
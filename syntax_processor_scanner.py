@@ -0,0 +1,73 @@
+import re
+from collections import namedtuple
+
+from syntax_processor_lexer import ProcessorLexer
+
+
+Token = namedtuple('Token', ['type', 'value', 'lineno', 'index', 'end'])
+
+# Spaces and tabs are consumed together with the next token, the group number tells its kind
+PATTERN = re.compile(r'''[ \t]*(?:
+    (\#.*)                                  # 1 comment
+  | (\n+)                                   # 2 newlines
+  | ([a-zA-Z_][a-zA-Z0-9_@]*)               # 3 identifier or keyword
+  | 0x([0-9a-fA-F]+)                        # 4 hexadecimal number
+  | 0b([01]+)                               # 5 binary number
+  | (\d+)                                   # 6 decimal number
+  | (==|!=|>=|<=|[-+*/=,<>()])              # 7 operator or literal
+  | (.)                                     # 8 error
+  | $)''', re.VERBOSE)
+
+KEYWORDS = {'and': 'AND', 'not': 'NOT', 'or': 'OR', 'in': 'IN'}
+
+TYPES = {
+    '==': 'EQ', '!=': 'NE', '>=': 'GE', '<=': 'LE',
+    '+': 'PLUS', '-': 'MINUS', '*': 'TIMES', '/': 'DIVIDE', '=': 'ASSIGN', ',': 'COMMA',
+    '>': 'GT', '<': 'LT', '(': '(', ')': ')',
+}
+
+
+class ProcessorScanner:
+    """
+        It is class that tokenizes the same syntax as ProcessorLexer in one pass of a single
+        regular expression. Tokens are named tuples (type, value, lineno, index, end),
+        characters that are not recognized are appended to self.errors like ProcessorLexer does
+    """
+    tokens = ProcessorLexer.tokens
+
+    def __init__(self):
+        self.errors = []
+        self.lineno = 1
+
+    def tokenize(self, text, lineno=1):
+        """
+            Gives the tokens of the text one by one
+        """
+        return iter(self.scan(text, lineno))
+
+    def scan(self, text, lineno=1):
+        """
+            Gives the list of tokens of the text
+        """
+        tokens = []
+        append = tokens.append
+        new = tuple.__new__
+        for match in PATTERN.finditer(text):
+            group = match.lastindex
+            if group == 3:
+                value = match[3]
+                append(new(Token, (KEYWORDS.get(value, 'ID'), value, lineno, match.start(3), match.end())))
+            elif group == 7:
+                value = match[7]
+                append(new(Token, (TYPES[value], value, lineno, match.start(7), match.end())))
+            elif group == 6:
+                append(new(Token, ('NUMBER', int(match[6]), lineno, match.start(6), match.end())))
+            elif group == 4 or group == 5:
+                value = int(match[group], 16 if group == 4 else 2)
+                append(new(Token, ('NUMBER', value, lineno, match.start(group) - 2, match.end())))
+            elif group == 2:
+                lineno += len(match[2])
+            elif group == 8:
+                self.errors.append(match[8])
+        self.lineno = lineno
+        return tokens
@@ -0,0 +1,346 @@
+import hashlib
+import importlib.util
+import mmap
+import struct
+import sys
+from collections.abc import Mapping
+
+from syntax_processor_condition import Condition, compile
+from syntax_processor_nodes import (AdaptiveAnd, AdaptiveOr, And, ArgList, Assign, BinOp, Call, In, InSet, Name,
+                                    Negate, Node, Not, Number, Or, literal)
+from syntax_processor_optimizer import arguments
+
+
+FORMAT_VERSION = 2
+MAGIC = b'SPCF'
+
+# magic, format version, count of conditions, grammar digest, offsets of strings, constants, index and nodes
+HEADER = struct.Struct('<4sHI32sIIII')
+# name, source, backend, errors, schema, tree
+ENTRY = struct.Struct('<IIBIII')
+U32 = struct.Struct('<I')
+NONE = 0xFFFFFFFF
+
+# the position of a type is its opcode, new types are appended
+NODE_TYPES = (Number, Name, BinOp, And, Or, Not, Negate, ArgList, In, InSet, AdaptiveAnd, AdaptiveOr, Assign, Call)
+OPCODES = {node_type: opcode for opcode, node_type in enumerate(NODE_TYPES)}
+
+# kinds of fields of a node record
+NODE, NODES, STRING, CONSTANT = range(4)
+
+BACKENDS = Condition.backends
+
+
+class FormatError(ValueError):
+    """
+        It is class of errors of files that are not compiled conditions of this version and grammar
+    """
+
+
+def grammar_digest():
+    """
+        Gives the digest of the lexer and parser sources and of the node types,
+        conditions serialized by another grammar are not loaded
+    """
+    digest = hashlib.sha256(repr((FORMAT_VERSION, [(node_type.__name__, node_type.fields)
+                                                    for node_type in NODE_TYPES])).encode())
+    for module in ('syntax_processor_lexer', 'syntax_processor_parser'):
+        # the modules are read without importing, so loading does not build the grammar
+        with open(importlib.util.find_spec(module).origin, 'rb') as file:
+            digest.update(file.read().replace(b'\r\n', b'\n'))
+    return digest.digest()
+
+
+class Encoder:
+    """
+        It is class that writes nodes of many conditions to one buffer. Every node is written
+        once after its children and referenced by its offset, so subtrees shared by
+        a RuleSet stay shared. Names and operators go to a string table, other values
+        to a pool of constants
+    """
+
+    def __init__(self):
+        self.strings = {}
+        self.constants = {}
+        self.constant_values = []
+        self.nodes = bytearray()
+        self.offsets = {}
+
+    def string(self, value):
+        return self.strings.setdefault(value, len(self.strings))
+
+    def constant(self, value):
+        data = encode_constant(value)
+        if data not in self.constants:
+            self.constants[data] = len(self.constant_values)
+            self.constant_values.append(data)
+        return self.constants[data]
+
+    def field(self, value):
+        if isinstance(value, Node) or value is None:
+            return [NODE, self.node(value)]
+        if isinstance(value, tuple) and all(isinstance(item, Node) for item in value):
+            return [NODES, len(value), *map(self.node, value)]
+        if isinstance(value, str):
+            return [STRING, self.string(value)]
+        return [CONSTANT, self.constant(value)]
+
+    def node(self, node):
+        """
+            Writes the node and gives its offset
+        """
+        if node is None:
+            return NONE
+        key = id(node)
+        if key not in self.offsets:
+            values = [OPCODES[type(node)]]
+            for value in arguments(node):
+                values.extend(self.field(value))
+            offset = len(self.nodes)
+            self.nodes += struct.pack(f'<{len(values)}I', *values)
+            # adaptive nodes keep statistics of their own evaluations, so they are not shared
+            if isinstance(node, AdaptiveAnd):
+                return offset
+            # the node is kept, so its id is not reused by another node
+            self.offsets[key] = (offset, node)
+        return self.offsets[key][0]
+
+
+def encode_constant(value):
+    if value is None:
+        return b'N'
+    if value is True or value is False:
+        return b'T' if value else b'F'
+    if isinstance(value, int):
+        length = (value.bit_length() + 8) // 8
+        return b'i' + U32.pack(length) + value.to_bytes(length, 'little', signed=True)
+    if isinstance(value, float):
+        return b'f' + struct.pack('<d', value)
+    if isinstance(value, str):
+        data = value.encode()
+        return b's' + U32.pack(len(data)) + data
+    for tag, kind in ((b'l', list), (b't', tuple), (b'z', frozenset)):
+        if isinstance(value, kind):
+            items = [encode_constant(item) for item in value]
+            if kind is frozenset:
+                items.sort()
+            return tag + U32.pack(len(items)) + b''.join(items)
+    if hasattr(value, 'type') and hasattr(value, 'value'):
+        # a syntax error keeps the token of sly
+        return b'k' + encode_constant((value.type, value.value, getattr(value, 'lineno', None),
+                                       getattr(value, 'index', None), getattr(value, 'end', None)))
+    raise TypeError(f'Can not serialize constant {value!r}')
+
+
+def decode_constant(data, offset):
+    """
+        Gives the constant at the offset and the offset after it
+    """
+    tag = data[offset:offset + 1]
+    offset += 1
+    if tag == b'N':
+        return None, offset
+    if tag in (b'T', b'F'):
+        return tag == b'T', offset
+    if tag == b'f':
+        return struct.unpack_from('<d', data, offset)[0], offset + 8
+    if tag in (b'i', b's'):
+        length = U32.unpack_from(data, offset)[0]
+        offset += U32.size
+        raw = bytes(data[offset:offset + length])
+        if tag == b'i':
+            return int.from_bytes(raw, 'little', signed=True), offset + length
+        return raw.decode(), offset + length
+    if tag in (b'l', b't', b'z'):
+        count = U32.unpack_from(data, offset)[0]
+        offset += U32.size
+        items = []
+        for _ in range(count):
+            item, offset = decode_constant(data, offset)
+            items.append(item)
+        return {b'l': list, b't': tuple, b'z': frozenset}[tag](items), offset
+    if tag == b'k':
+        from sly.lex import Token
+
+        token = Token()
+        (token.type, token.value, token.lineno, token.index, token.end), offset = decode_constant(data, offset)
+        return token, offset
+    raise FormatError(f'Unknown constant tag {tag!r}')
+
+
+def encode_schema(schema):
+    """
+        Gives the schema {name: type} as a tuple of pairs (name, name of type) for the pool of constants
+    """
+    if schema is None:
+        return None
+    return tuple(sorted((name, kind.__name__) for name, kind in schema.items()))
+
+
+def dumps(conditions):
+    """
+        Gives the bytes of the compiled conditions given as a mapping {name: Condition or text},
+        names are strings. Schemas of conditions are kept, loaded conditions are type-checked again
+    """
+    encoder = Encoder()
+    entries = []
+    for name, condition in conditions.items():
+        if not isinstance(condition, Condition):
+            condition = compile(condition)
+        entries.append(ENTRY.pack(encoder.string(name), encoder.string(condition.source),
+                                  BACKENDS.index(condition.backend), encoder.constant(condition.errors),
+                                  encoder.constant(encode_schema(condition.schema)), encoder.node(condition.tree)))
+
+    strings = [U32.pack(len(encoder.strings))]
+    for value in encoder.strings:
+        data = value.encode()
+        strings += [U32.pack(len(data)), data]
+    strings = b''.join(strings)
+    constants = U32.pack(len(encoder.constant_values)) + b''.join(encoder.constant_values)
+
+    strings_offset = HEADER.size
+    constants_offset = strings_offset + len(strings)
+    index_offset = constants_offset + len(constants)
+    nodes_offset = index_offset + ENTRY.size * len(entries)
+    header = HEADER.pack(MAGIC, FORMAT_VERSION, len(entries), grammar_digest(),
+                         strings_offset, constants_offset, index_offset, nodes_offset)
+    return b''.join([header, strings, constants, *entries, bytes(encoder.nodes)])
+
+
+def dump(conditions, path):
+    """
+        Writes the compiled conditions to the file
+    """
+    with open(path, 'wb') as file:
+        file.write(dumps(conditions))
+
+
+# count of fields of the record of every opcode
+ARITIES = tuple(2 if issubclass(node_type, AdaptiveAnd) else len(node_type.fields) for node_type in NODE_TYPES)
+
+
+class ConditionFile(Mapping):
+    """
+        It is class of compiled conditions read from bytes or from a memory mapped file.
+        Nothing is lexed or parsed, a condition is decoded at its first access,
+        so processes that map one file share its pages and decode only the rules they use
+    """
+
+    def __init__(self, data):
+        self.buffer = data
+        self.data = memoryview(data)
+        if len(self.data) < HEADER.size:
+            raise FormatError('File is too short for compiled conditions')
+        (magic, version, count, digest, strings_offset, constants_offset,
+         index_offset, self.nodes_offset) = HEADER.unpack_from(self.data)
+        if magic != MAGIC:
+            raise FormatError('File is not compiled conditions')
+        if version != FORMAT_VERSION:
+            raise FormatError(f'Format version {version} is not supported, expected {FORMAT_VERSION}')
+        if digest != grammar_digest():
+            raise FormatError('Conditions were compiled by another grammar')
+
+        self.strings = []
+        offset = strings_offset + U32.size
+        for _ in range(U32.unpack_from(self.data, strings_offset)[0]):
+            length = U32.unpack_from(self.data, offset)[0]
+            offset += U32.size
+            self.strings.append(sys.intern(bytes(self.data[offset:offset + length]).decode()))
+            offset += length
+        self.constants = []
+        offset = constants_offset + U32.size
+        for _ in range(U32.unpack_from(self.data, constants_offset)[0]):
+            value, offset = decode_constant(self.data, offset)
+            self.constants.append(value)
+        self.index = {}
+        for number in range(count):
+            entry = ENTRY.unpack_from(self.data, index_offset + number * ENTRY.size)
+            self.index[self.strings[entry[0]]] = entry[1:]
+        # node records are read as words in place
+        self.words = self.data[self.nodes_offset:].cast('I')
+        if sys.byteorder == 'big':
+            self.words = [int.from_bytes(self.data[offset:offset + 4], 'little')
+                          for offset in range(self.nodes_offset, len(self.data), 4)]
+        self.nodes = {}
+        self.conditions = {}
+
+    def node(self, offset):
+        """
+            Decodes the node at the offset, a node referenced many times is decoded once
+        """
+        if offset == NONE:
+            return None
+        if offset in self.nodes:
+            return self.nodes[offset]
+        words = self.words
+        position = offset // 4
+        opcode = words[position]
+        position += 1
+        values = []
+        for _ in range(ARITIES[opcode]):
+            kind, value = words[position], words[position + 1]
+            position += 2
+            if kind == NODE:
+                values.append(self.node(value))
+            elif kind == NODES:
+                values.append(tuple(map(self.node, words[position:position + value])))
+                position += value
+            elif kind == STRING:
+                values.append(self.strings[value])
+            else:
+                values.append(self.constants[value])
+        node = literal(*values) if opcode == OPCODES[Number] else NODE_TYPES[opcode](*values)
+        if not isinstance(node, AdaptiveAnd):
+            self.nodes[offset] = node
+        return node
+
+    def __getitem__(self, name):
+        if name not in self.conditions:
+            source, backend, errors, schema, tree = self.index[name]
+            schema = self.constants[schema]
+            self.conditions[name] = Condition(self.strings[source], self.node(tree), self.constants[errors],
+                                              BACKENDS[backend], None if schema is None else dict(schema))
+        return self.conditions[name]
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        if isinstance(self.words, memoryview):
+            self.words.release()
+        self.data.release()
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+
+def loads(data):
+    """
+        Gives the dict {name: Condition} of the bytes given by dumps()
+    """
+    with ConditionFile(data) as conditions:
+        return dict(conditions)
+
+
+def load(path):
+    """
+        Maps the file read-only and gives its ConditionFile, the file is closed by close()
+    """
+    with open(path, 'rb') as file:
+        try:
+            data = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise FormatError('File is empty') from None
+    try:
+        return ConditionFile(data)
+    except Exception:
+        data.close()
+        raise
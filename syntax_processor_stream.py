@@ -0,0 +1,49 @@
+from collections import namedtuple
+
+from syntax_processor_lexer import ProcessorLexer
+from syntax_processor_nodes import Assign
+from syntax_processor_parser import ProcessorParser
+
+
+Result = namedtuple('Result', ['lineno', 'source', 'value', 'errors'])
+Result.__doc__ = """
+    It is result of a statement of a stream, value is None for assignments and statements
+    with syntax errors. errors keeps lexer errors, syntax errors, ('undefined', name) and
+    exceptions raised by the evaluation
+"""
+
+
+def evaluate_lines(lines, names=None, lexer=ProcessorLexer):
+    """
+        Parses and evaluates statements given one per line by any iterable of lines
+        and gives a Result for every statement as soon as its line is read.
+        Assignments are kept at names, so later lines can use them.
+        Errors do not stop the stream, empty and comment lines are skipped
+    """
+    if names is None:
+        names = {}
+    parser = ProcessorParser()
+    parser.names = names
+    for lineno, line in enumerate(lines, 1):
+        source = line.strip()
+        if not source or source.startswith('#'):
+            continue
+        scanner = lexer()
+        parser.errors = []
+        tree = parser.parse_tree(scanner.tokenize(source, lineno=lineno))
+        errors = scanner.errors + parser.errors
+        value = None
+        if tree is not None:
+            try:
+                value = tree.evaluate(names, errors)
+            except Exception as error:
+                errors.append(error)
+        yield Result(lineno, source, None if isinstance(tree, Assign) else value, errors)
+
+
+def evaluate_file(path, names=None, lexer=ProcessorLexer, encoding='utf-8'):
+    """
+        Gives a Result for every statement of the file, the file is read line by line
+    """
+    with open(path, encoding=encoding) as file:
+        yield from evaluate_lines(file, names, lexer)
@@ -0,0 +1,98 @@
+import hashlib
+import os
+import pickle
+import tempfile
+
+import sly
+from sly.yacc import YaccError
+
+
+TABLES_VERSION = 1
+
+
+class CachedLRTable:
+    """
+        It is class that keeps the parts of sly.yacc.LRTable used by Parser.parse
+    """
+
+    def __init__(self, lr_action, lr_goto, defaulted_states, sr_conflicts, rr_conflicts):
+        self.lr_action = lr_action
+        self.lr_goto = lr_goto
+        self.defaulted_states = defaulted_states
+        self.sr_conflicts = sr_conflicts
+        self.rr_conflicts = rr_conflicts
+
+
+def default_path():
+    """
+        Gives the path of the tables file, CONDITION_PROCESSOR_TABLES overrides it
+    """
+    return os.environ.get('CONDITION_PROCESSOR_TABLES') or os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '__pycache__', 'syntax_processor_parser.tables')
+
+
+def grammar_hash(grammar):
+    """
+        Gives the hash of the productions and precedence of the grammar,
+        the tables are regenerated when it changes
+    """
+    text = repr((TABLES_VERSION, sly.__version__, grammar.Start,
+                 [(production.name, production.prod, production.prec) for production in grammar.Productions],
+                 sorted(grammar.Precedence.items())))
+    return hashlib.sha256(text.encode()).hexdigest()
+
+
+def load_tables(path, key):
+    """
+        Gives the CachedLRTable from the file, None when it is missing, broken or made for another grammar
+    """
+    try:
+        with open(path, 'rb') as file:
+            data = pickle.load(file)
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get('version') != TABLES_VERSION or data.get('hash') != key:
+        return None
+    return CachedLRTable(data['action'], data['goto'], data['defaulted'], data['sr'], data['rr'])
+
+
+def save_tables(path, key, table):
+    """
+        Writes the tables to the file at once, a directory that can not be written is ignored
+    """
+    data = {'version': TABLES_VERSION, 'hash': key, 'action': table.lr_action, 'goto': table.lr_goto,
+            'defaulted': table.defaulted_states,
+            'sr': [tuple(map(str, conflict)) for conflict in table.sr_conflicts],
+            'rr': [tuple(map(str, conflict)) for conflict in table.rr_conflicts]}
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as file:
+            pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    except OSError:
+        return False
+    return True
+
+
+def build(cls, definitions, path=None):
+    """
+        Builds the grammar of the sly Parser class like Parser._build does,
+        the LALR tables are loaded from the file and computed only when the grammar changed
+    """
+    rules = cls._Parser__collect_rules(definitions)
+    if not cls._Parser__validate_specification():
+        raise YaccError('Invalid parser specification')
+    cls._Parser__build_grammar(rules)
+
+    path = path or default_path()
+    key = grammar_hash(cls._grammar)
+    table = load_tables(path, key)
+    if table is None:
+        if not cls._Parser__build_lrtables():
+            raise YaccError('Can\'t build parsing tables')
+        save_tables(path, key, cls._lrtable)
+        return False
+    cls._lrtable = table
+    return True
@@ -0,0 +1,151 @@
+from syntax_processor_nodes import Number
+
+
+TYPES = {'int': int, 'float': float, 'bool': bool, 'list': list}
+NUMERIC = (bool, int, float)
+ORDERING = {'>', '<', '>=', '<='}
+
+
+class TypeCheckError(TypeError):
+    """
+        It is class of errors of conditions that can not be evaluated with variables of the schema,
+        problems keeps the text of every error found
+    """
+
+    def __init__(self, source, problems):
+        super().__init__(f'{source!r}: ' + '; '.join(problems))
+        self.source = source
+        self.problems = problems
+
+
+def normalize_schema(schema):
+    """
+        Gives the schema {name: type}, types are int, float, bool, list or their names
+    """
+    result = {}
+    for name, kind in schema.items():
+        kind = TYPES.get(kind, kind)
+        if kind not in TYPES.values():
+            raise ValueError(f'Unknown type {kind!r} of variable {name!r}, expected one of {", ".join(TYPES)}')
+        result[name] = kind
+    return result
+
+
+class TypeChecker:
+    """
+        It is class that infers the type of every node of a tree from the types of variables.
+        The type object means any value, like results of functions
+    """
+
+    def __init__(self, schema):
+        self.schema = normalize_schema(schema)
+        self.types = {}
+        self.problems = []
+
+    def check(self, node):
+        """
+            Gives the type of the node, types of all nodes are kept at self.types by their ids
+        """
+        if node is None:
+            return type(None)
+        # subclasses of nodes, like the counting ones of metrics, are checked as their bases
+        method = next(getattr(self, 'check_' + base.__name__) for base in type(node).__mro__
+                      if hasattr(self, 'check_' + base.__name__))
+        kind = method(node)
+        self.types[id(node)] = kind
+        return kind
+
+    def problem(self, text):
+        self.problems.append(text)
+        return object
+
+    def check_Number(self, node):
+        return type(node.value) if isinstance(node.value, (*NUMERIC, list)) else object
+
+    def check_Name(self, node):
+        if node.name not in self.schema:
+            return self.problem(f'variable {node.name!r} is not in the schema')
+        return self.schema[node.name]
+
+    def check_BinOp(self, node):
+        left, right = self.check(node.left), self.check(node.right)
+        if node.op == '/' and isinstance(node.right, Number) and node.right.value == 0:
+            return self.problem('division by zero')
+        if node.op in ('==', '!='):
+            return bool
+        if object in (left, right):
+            return bool if node.op in ORDERING else object
+        if node.op in ORDERING:
+            if (left in NUMERIC and right in NUMERIC) or left is right is list:
+                return bool
+        elif left in NUMERIC and right in NUMERIC:
+            if node.op == '/' or float in (left, right):
+                return float
+            return int
+        elif node.op == '+' and left is right is list:
+            return list
+        elif node.op == '*' and {left, right} in ({list, int}, {list, bool}):
+            return list
+        return self.problem(f'unsupported operand types for {node.op}: {left.__name__} and {right.__name__}')
+
+    def check_And(self, node):
+        self.check(node.left)
+        self.check(node.right)
+        return bool
+
+    check_Or = check_And
+
+    def check_Not(self, node):
+        self.check(node.operand)
+        return bool
+
+    def check_Negate(self, node):
+        operand = self.check(node.operand)
+        if operand is object or operand is float:
+            return operand
+        if operand in NUMERIC:
+            return int
+        return self.problem(f'bad operand type for unary -: {operand.__name__}')
+
+    def check_ArgList(self, node):
+        for item in node.items:
+            self.check(item)
+        return list
+
+    def check_In(self, node):
+        self.check(node.expr)
+        if node.arglist is None:
+            return self.problem('"in ()" has no list')
+        self.check(node.arglist)
+        return bool
+
+    def check_InSet(self, node):
+        self.check(node.expr)
+        return bool
+
+    def check_AdaptiveAnd(self, node):
+        for operand in node.operands:
+            self.check(operand)
+        return bool
+
+    check_AdaptiveOr = check_AdaptiveAnd
+
+    def check_Assign(self, node):
+        self.check(node.expr)
+        return type(None)
+
+    def check_Call(self, node):
+        self.check(node.arglist)
+        return object
+
+
+def check(tree, schema, source=''):
+    """
+        Type-checks the tree against the schema {name: type} and gives the types of its nodes
+        by their ids, a tree with errors raises TypeCheckError listing all of them
+    """
+    checker = TypeChecker(schema)
+    checker.check(tree)
+    if checker.problems:
+        raise TypeCheckError(source, checker.problems)
+    return checker.types
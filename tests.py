@@ -1,4 +1,27 @@
+import pytest
+import asyncio
+import pickle
+import threading
+
 from syntax_processor_parser import ProcessorLexer, ProcessorParser
+from syntax_processor_condition import Condition, Context, compile
+from syntax_processor_nodes import AdaptiveAnd, InSet, memory_report
+from syntax_processor_optimizer import rebuild
+from syntax_processor_ruleset import RuleSet
+from syntax_processor_index import IndexedRuleSet
+from syntax_processor_scanner import ProcessorScanner
+from syntax_processor_stream import evaluate_file, evaluate_lines
+from syntax_processor_incremental import IncrementalEvaluator
+from syntax_processor_parallel import ParallelEvaluator
+from syntax_processor_async import evaluate_async
+from syntax_processor_functions import functions
+from syntax_processor_cache import ConditionCache, compile_cached, sizeof
+from syntax_processor_tables import grammar_hash, load_tables, save_tables
+from syntax_processor_serialize import FormatError, dump, dumps, load, loads
+from syntax_processor_metrics import Metrics
+from syntax_processor_types import TypeCheckError
+import syntax_processor_cli
+import benchmarks
 
 # Test basic recognition of various tokens and literals
 
@@ -548,3 +571,858 @@ def test_parse_operations_with_precedence():
 
 
 
+
+
+def test_compile_condition():
+    condition = compile('a > 3 and b in (1, 2)')
+    assert not condition.errors
+    assert condition.evaluate({'a': 4, 'b': 2}) is True
+    assert condition.evaluate({'a': 4, 'b': 3}) is False
+    assert condition.evaluate({'a': 2, 'b': 1}) is False
+
+    errors = []
+    assert condition.evaluate({'b': 1}, errors) is False
+    assert errors == [('undefined', 'a')]
+
+    names = {}
+    assert compile('a = 3 + 4 * (5 + 6)').evaluate(names) is None
+    assert names['a'] == 47
+
+    assert compile('a(2+3, 4+5)').evaluate() == ('a', [5, 9])
+    assert compile('(((((((([2, 3]))))))))').evaluate() == [2, 3]
+
+    condition = compile('a 123 4 + 5')
+    assert condition.evaluate() == 9
+    assert len(condition.errors) == 1
+    assert condition.errors[0].type == 'NUMBER'
+
+
+def test_compile_matches_parser():
+    sources = ['3 + 4 * 5', '-5 - -10', '2 + 2 == (2 + 2)', '1 <= 2 > 3', '0x1f + 0b101',
+               'not (not (5 == 5) or not (5 == 5)) or (5 == 4)', '4 in [(a/2)*4, 3]',
+               '(2 < 3 or 1 > a)']
+    for source in sources:
+        lexer = ProcessorLexer()
+        parser = ProcessorParser()
+        parser.parse(lexer.tokenize('a = 2'))
+        assert compile(source).evaluate({'a': 2}) == parser.parse(lexer.tokenize(source))
+
+
+def test_compile_code_backend():
+    sources = ['3 + 4 * 5', '-5 - -10', '2 + 2 == (2 + 2)', '1 <= 2 > 3', '0x1f + 0b101', '7 / 2',
+               'not (not (5 == 5) or not (5 == 5)) or (5 == 4)', '4 in [(a/2)*4, 3]',
+               '(2 < 3 or 1 > a)', 'a(2+3, 4+5)', 'a()', '([2, 3])', 'b in [2, 3] and (c < 3)']
+    for source in sources:
+        tree_errors = []
+        code_errors = []
+        expected = compile(source).evaluate({'a': 2}, tree_errors)
+        result = compile(source, backend='code').evaluate({'a': 2}, code_errors)
+        assert result == expected
+        assert type(result) is type(expected)
+        assert code_errors == tree_errors
+
+    names = {'b': 3}
+    assert compile('a = b * 2', backend='code').evaluate(names) is None
+    assert names['a'] == 6
+
+    errors = []
+    assert compile('x and 1', backend='code').evaluate({}, errors) is False
+    assert errors == [('undefined', 'x')]
+
+    # folded to inf and nan, which have no literals
+    infinite = 'x < 7 / 2 * 1' + '0' * 300 + ' * 1' + '0' * 300
+    for backend in Condition.backends:
+        assert compile(infinite, backend=backend).evaluate({'x': 1}) is True
+        assert compile(infinite + ' * 0', backend=backend).evaluate({'x': 1}) is False
+
+
+def test_condition_cache():
+    cache = ConditionCache(max_entries=2)
+    condition = cache.get('a > 3')
+    assert cache.get('  a  >   3 ') is condition
+    assert cache.get('a > 3', backend='code') is not condition
+    assert cache.stats()['hits'] == 1
+    assert cache.stats()['misses'] == 2
+
+    cache.get('a < 3')
+    assert cache.stats()['evictions'] == 1
+    assert len(cache) == 2
+    assert cache.get('a < 3').evaluate({'a': 1}) is True
+
+    cache.invalidate('a < 3')
+    assert 'a < 3' not in cache
+    assert 'a > 3' in cache
+
+    cache.resize(max_bytes=1)
+    assert len(cache) == 0
+    assert cache.stats()['bytes'] == 0
+
+    cache = ConditionCache(max_entries=None, max_bytes=sizeof(compile('a > 3')) * 2)
+    for number in range(10):
+        cache.get(f'a > {number}')
+    assert 0 < len(cache) < 10
+    cache.clear()
+    assert len(cache) == 0
+
+
+def test_compile_cached():
+    assert compile_cached('1 + 2 * a') is compile_cached('1 + 2 * a')
+    assert compile_cached('1 + 2 * a').evaluate({'a': 3}) == 7
+
+
+def test_evaluate_batch():
+    np = pytest.importorskip('numpy')
+    from syntax_processor_batch import evaluate_batch
+
+    columns = {'a': np.array([1, 2, 3, 4]), 'b': np.array([0, 1, 2, 0])}
+    result = evaluate_batch('a > 2 and b in (0, 2)', columns)
+    assert result.tolist() == [False, False, True, True]
+    assert not result.mask.any()
+
+    result = evaluate_batch('-a + 4 * (b - 1)', columns)
+    assert result.tolist() == [-5, -2, 1, -8]
+
+    result = evaluate_batch('not (a == 2) or (b != 1)', columns)
+    assert result.tolist() == [True, False, True, True]
+
+    result = evaluate_batch('a / b', columns)
+    assert result.mask.tolist() == [True, False, False, True]
+    assert result[1] == 2.0
+    assert result[2] == 1.5
+
+    result = evaluate_batch('a in (b + 1, 4)', columns)
+    assert result.tolist() == [True, True, True, True]
+
+    result = evaluate_batch('a > 1 and c < 3', columns)
+    assert result.mask.tolist() == [False, True, True, True]
+
+    result = evaluate_batch('(b == 0) or (a / b > 1)', columns)
+    assert result.tolist() == [True, True, True, True]
+    assert not result.mask.any()
+
+
+    result = evaluate_batch('0x10 + 0b1', columns)
+    assert result.tolist() == [17, 17, 17, 17]
+
+    for source in ['a > 2 and b in (0, 2)', '-a + 4 * (b - 1)', 'not (a == 2) or (b != 1)', 'a in (b + 1, 4)',
+                   '(a > 1) + (a > 2)', '(a > 1) - (a > 2)', '-(a > 1)', '(a > 1) * 3 + (b == 0) / 2']:
+        expected = [compile(source).evaluate({'a': int(a), 'b': int(b)})
+                    for a, b in zip(columns['a'], columns['b'])]
+        assert evaluate_batch(source, columns).tolist() == expected
+
+
+def test_short_circuit():
+    lexer = ProcessorLexer()
+    parser = ProcessorParser()
+    result = parser.parse(lexer.tokenize('1 > 2 and b > 1'))
+    assert result is False
+    assert not parser.errors
+
+    result = parser.parse(lexer.tokenize('1 < 2 or 1 / 0'))
+    assert result is True
+    assert not parser.errors
+
+    result = parser.parse(lexer.tokenize('1 < 2 and b > 1'))
+    assert result is False
+    assert parser.errors == [('undefined', 'b')]
+
+    for backend in Condition.backends:
+        errors = []
+        assert compile('0 and c', backend=backend).evaluate({}, errors) is False
+        assert compile('2 or c', backend=backend).evaluate({}, errors) is True
+        assert not errors
+
+
+def test_reorder():
+    condition = compile('(a * a + a * a > 3) and (b == 1) and c > 0', reorder=True)
+    assert isinstance(condition.tree, AdaptiveAnd)
+    assert len(condition.tree.operands) == 3
+
+    calls = []
+    names = {'b': 2, 'c': 1}
+    for _ in range(AdaptiveAnd.reorder_interval * 2):
+        names['a'] = 1 + len(calls) % 3
+        calls.append(condition.evaluate(names))
+    assert not any(calls)
+    assert condition.tree.order[0][0] == compile('(b == 1)').tree
+
+    costs = [entry[1] for entry in compile('(a * a + a * a > 3) and (b == 1) and c > 0', reorder=True).tree.order]
+    copy = rebuild(condition.tree, lambda child: compile('(b == 2)').tree if child == compile('(b == 1)').tree else child)
+    assert sorted(entry[1] for entry in copy.order) == sorted(costs) and len(set(costs)) > 1
+
+    for source in ['a and b or c', 'not a or b and c or d', '(a or b) and (c or d) and e']:
+        condition = compile(source, reorder=True)
+        expected = compile(source)
+        for bits in range(32):
+            names = dict(zip('abcde', [bits >> shift & 1 for shift in range(5)]))
+            assert condition.evaluate(names) == expected.evaluate(names)
+            assert compile(source, backend='code', reorder=True).evaluate(names) == expected.evaluate(names)
+
+
+def test_reorder_guards():
+    # the division decides the chain, so it would be moved before its guard
+    for source, value in [('(b != 0) and (a / b > 1) and c > 0', False), ('(b == 0) or (a / b > 1) or c > 0', True)]:
+        condition = compile(source, reorder=True)
+        for _ in range(AdaptiveAnd.reorder_interval * 3):
+            assert condition.evaluate({'a': 4 if value else 1, 'b': 2, 'c': 1}) is value
+        assert condition.evaluate({'a': 1, 'b': 0, 'c': 0}) is value
+        assert condition.tree.order[0][0] == compile(source.split(')')[0] + ')').tree
+
+
+def test_long_chains():
+    names = {f'a{number}': number for number in range(1500)}
+    total = ' + '.join(names)
+    lexer = ProcessorLexer()
+    parser = ProcessorParser()
+    parser.names.update(names)
+    assert parser.parse(lexer.tokenize(total)) == sum(names.values())
+    assert not parser.errors
+
+    nested = ' - '.join(f'{name} * 2' for name in names) + f' + ({total}) > 0'
+    logical = ' and '.join(f'{name} >= 0' for name in names) + ' or a1 < 0'
+    for backend in Condition.backends:
+        assert compile(total, backend=backend).evaluate(names) == sum(names.values())
+        assert compile(nested, backend=backend).evaluate(names) is False
+        for reorder in (False, True) if backend != 'slots' else (False,):
+            assert compile(logical, backend=backend, reorder=reorder).evaluate(names) is True
+    assert compile('1 + ' * 1500 + 'x').simplified == '(1500 + x)'
+    assert compile(total).simplified.startswith('(' * 1499 + 'a0 + a1)')
+
+
+def test_rule_set():
+    rules = {
+        'low': '(status == 3) and level < 2',
+        'high': '(status == 3) and level > 5',
+        'region': 'region in (1, 2, 4) and (status == 3)',
+        'other': 'not (region in (1, 2, 4))',
+    }
+    rule_set = RuleSet(rules)
+    assert len(rule_set) == 4
+    assert not rule_set.errors
+    assert compile('(status == 3)').tree in rule_set.shared()
+    assert compile('region in (1, 2, 4)').tree in rule_set.shared()
+
+    assert rule_set.match({'status': 3, 'level': 1, 'region': 2}) == ['low', 'region']
+    assert rule_set.match({'status': 3, 'level': 7, 'region': 5}) == ['high', 'other']
+    assert rule_set.match({'status': 2, 'level': 7, 'region': 1}) == []
+
+    for names in [{'status': 3, 'level': 1, 'region': 2}, {'status': 1, 'level': 9, 'region': 9}]:
+        expected = [rule_id for rule_id, text in rules.items() if compile(text).evaluate(names)]
+        assert rule_set.match(names) == expected
+
+    nodes = len(rule_set.nodes)
+    rule_set.remove('other')
+    assert len(rule_set.nodes) < nodes
+    assert compile('not (region in (1, 2, 4))').tree not in rule_set.nodes.values()
+    rule_set.add('all', '1')
+    assert rule_set.match({'status': 3, 'level': 7, 'region': 5}) == ['high', 'all']
+
+    errors = []
+    assert rule_set.match({}, errors) == ['all']
+    assert errors.count(('undefined', 'status')) == 1
+
+    adaptive = RuleSet({'one': compile('a and b', reorder=True), 'two': compile('a and b', reorder=True)})
+    assert adaptive.rules['one'] is not adaptive.rules['two']
+    assert adaptive.rules['one'].operands[0] is adaptive.rules['two'].operands[0]
+
+
+def test_indexed_rule_set():
+    rules = {
+        'low': '(status == 3) and level < 2',
+        'high': '(3 == status) and level > 5',
+        'region': 'region in (1, 2, 4) and (status == 3)',
+        'zero': '(status == 0)',
+        'other': 'not (region in (1, 2, 4))',
+    }
+    rule_set = IndexedRuleSet(rules)
+    plain = RuleSet(rules)
+    for status in range(5):
+        for level in (1, 7):
+            for region in (1, 5):
+                names = {'status': status, 'level': level, 'region': region}
+                assert rule_set.match(names) == plain.match(names)
+
+    assert sorted(rule_set.candidates({'status': 2, 'region': 5})) == [4]
+    assert sorted(rule_set.candidates({'status': 3, 'region': 5})) == [0, 1, 2, 4]
+    assert sorted(rule_set.candidates({'status': 3.0, 'region': [1]})) == [0, 1, 2, 4]
+    assert rule_set.match({'region': 5}) == ['zero', 'other']
+
+    rule_set.add('many', 'kind in (7, 8, 9) and (kind == 8)')
+    assert sorted(rule_set.candidates({'kind': 8, 'region': 1})) == [3, 4, 5]
+    assert rule_set.match({'kind': 8, 'status': 3, 'region': 1}) == ['low', 'region', 'many']
+
+
+def test_in_constant_list_set():
+    source = 'x in (' + ', '.join(str(number) for number in range(0, 20000, 2)) + ')'
+    for backend in Condition.backends:
+        condition = compile(source, backend=backend)
+        assert isinstance(condition.tree, InSet)
+        assert condition.evaluate({'x': 9998}) is True
+        assert condition.evaluate({'x': 9999}) is False
+        assert condition.evaluate({'x': 4.0}) is True
+        assert condition.evaluate({'x': [4]}) is False
+        assert condition.evaluate({}) is True
+
+    condition = compile('x in (0x10, 0b11, y)')
+    assert not isinstance(condition.tree, InSet)
+    assert condition.evaluate({'x': 5, 'y': 5}) is True
+    assert compile('x in [(a/2)*4, 3]').evaluate({'x': 4, 'a': 2}) is True
+
+
+def test_simplify():
+    assert compile('x > 3 + 4 * (5 + 6)').simplified == '(x > 47)'
+    assert compile('x > 0x10 - 0b11').simplified == '(x > 13)'
+    assert compile('not not (x > 1)').simplified == '(x > 1)'
+    assert compile('not not x').simplified == '(not (not x))'
+    assert compile('not not x and y').simplified == '(x and y)'
+    assert compile('1 and (x > 1)').simplified == '(x > 1)'
+    assert compile('0 or x').simplified == '(not (not x))'
+    assert compile('(x < 1) or 0').simplified == '(x < 1)'
+    assert compile('x and 0').simplified == '(x and 0)'
+    assert compile('0 and x').simplified == 'False'
+    assert compile('7 / 2 > x').simplified == '(3.5 > x)'
+    assert compile('x in (1 + 1, 3)').simplified == '(x in (2, 3))'
+    assert compile('2 in (1 + 1, 3)').simplified == 'True'
+    assert compile('a = -(2 * 3)').simplified == 'a = -6'
+    assert compile('f(1 + 2, x)').simplified == 'f(3, x)'
+    assert compile('1 / 0').simplified == '(1 / 0)'
+
+
+def test_simplify_matches_parser():
+    sources = ['x > 3 + 4 * (5 + 6)', 'not not x', 'not not (x > 1)', 'not not x and y', 'not (not x or y)',
+               '1 and x', 'x and 1', '0 or x', 'x or 0', 'x and 0', '0 and x', 'x or 1', '1 or x',
+               '(1 < 2) + x', '-(-x) * (2 - 3)', 'x in (1 + 1, 0x3)', '2 in (1 + 1, 3)', 'x / (2 - 2) and 0',
+               'not (0 or not x)', '(not 0) + (not 1)', 'x, 2 * 3', 'f(1 + 2, not not x)', '0b101 == 5 and y']
+    for source in sources:
+        for names in [{}, {'x': 0}, {'x': 2}, {'x': 47, 'y': 1}, {'x': 5, 'y': 0}]:
+            lexer = ProcessorLexer()
+            parser = ProcessorParser()
+            parser.names = dict(names)
+            try:
+                expected = parser.parse(lexer.tokenize(source))
+            except ZeroDivisionError:
+                with pytest.raises(ZeroDivisionError):
+                    compile(source).evaluate(dict(names))
+                continue
+            for backend in Condition.backends:
+                errors = []
+                result = compile(source, backend=backend).evaluate(dict(names), errors)
+                assert result == expected
+                assert type(result) is type(expected)
+                if backend == 'slots':
+                    # missing variables are reported once per evaluation
+                    assert set(errors) == set(parser.errors)
+                else:
+                    assert errors == parser.errors
+
+
+def test_benchmarks_compare():
+    baseline = {'version': benchmarks.FORMAT_VERSION, 'results': {'a': {'best': 1.0}, 'b': {'best': 1.0}}}
+    current = {'version': benchmarks.FORMAT_VERSION, 'results': {'a': {'best': 1.05}, 'b': {'best': 1.5},
+                                                                  'c': {'best': 1.0}}}
+    rows = benchmarks.compare(baseline, current, threshold=0.1)
+    assert [(name, regressed) for name, _, _, _, regressed in rows] == [('a', False), ('b', True)]
+
+    with pytest.raises(ValueError):
+        benchmarks.compare({'version': 0, 'results': {}}, current)
+
+    results = benchmarks.run(['evaluate.code'], repeat=1, min_time=0.001)
+    assert list(results['results']) == ['evaluate.code.typical', 'evaluate.code.reused']
+
+
+def test_scanner():
+    sources = ['a = 3 + 4 * (5 + 6)', '0x1F != 0b101 >= 12 <= 0b2 == 0xg', 'index or android and notes',
+               'a # comment\n\n+ b\t# more\n-c', '[1, 2] ! \r é', 'x_1@2 in (1,2)', '']
+    for source in sources:
+        lexer = ProcessorLexer()
+        scanner = ProcessorScanner()
+        expected = [(token.type, token.value, token.lineno, token.index, token.end)
+                    for token in lexer.tokenize(source)]
+        assert [tuple(token) for token in scanner.tokenize(source)] == expected
+        assert scanner.errors == lexer.errors
+
+    parser = ProcessorParser()
+    result = parser.parse(ProcessorScanner().tokenize('a 123 4 + 5'))
+    assert result == 9
+    assert parser.errors[0].type == 'NUMBER'
+    assert parser.errors[0].value == 123
+
+    condition = compile('a > 0x10 and b in (1, 2)', lexer=ProcessorScanner)
+    assert condition.evaluate({'a': 17, 'b': 2}) is True
+
+
+def test_identifiers_starting_with_keywords():
+    for lexer_class in (ProcessorLexer, ProcessorScanner):
+        lexer = lexer_class()
+        tokens = [(token.type, token.value) for token in lexer.tokenize('index or order and notes in (android, inner)')]
+        assert tokens == [('ID', 'index'), ('OR', 'or'), ('ID', 'order'), ('AND', 'and'), ('ID', 'notes'),
+                          ('IN', 'in'), ('(', '('), ('ID', 'android'), ('COMMA', ','), ('ID', 'inner'), (')', ')')]
+        assert not lexer.errors
+
+    lexer = ProcessorLexer()
+    parser = ProcessorParser()
+    parser.parse(lexer.tokenize('index = 3'))
+    parser.parse(lexer.tokenize('order = 4'))
+    result = parser.parse(lexer.tokenize('index in (1, 3) and not order < 2'))
+    assert result is True
+    assert parser.names == {'index': 3, 'order': 4}
+    assert not parser.errors
+
+
+def test_evaluate_lines():
+    lines = ['# rules', 'a = 2', '', 'a * 3', 'b + 1', 'a 123 4 + 5', '1 / 0', 'c = a > 1', 'c and not b']
+    for lexer_class in (ProcessorLexer, ProcessorScanner):
+        names = {}
+        results = list(evaluate_lines(iter(lines), names, lexer=lexer_class))
+        assert [result.lineno for result in results] == [2, 4, 5, 6, 7, 8, 9]
+        assert [result.value for result in results] == [None, 6, 1, 9, None, None, True]
+        assert results[0].errors == []
+        assert results[2].errors == [('undefined', 'b')]
+        assert results[3].errors[0].type == 'NUMBER'
+        assert results[3].errors[0].lineno == 6
+        assert isinstance(results[4].errors[0], ZeroDivisionError)
+        assert names == {'a': 2, 'c': True}
+
+    stream = evaluate_lines(f'x = {number}' for number in range(10 ** 9))
+    assert next(stream).source == 'x = 0'
+    assert next(stream).lineno == 2
+
+
+def test_evaluate_file(tmp_path):
+    path = tmp_path / 'rules.txt'
+    path.write_text('a = 0x10\n# comment\na + 1\n')
+    assert [(result.lineno, result.value) for result in evaluate_file(path)] == [(1, None), (3, 17)]
+
+
+def test_incremental_evaluator():
+    evaluator = IncrementalEvaluator({'b': 1, 'd': 0})
+    evaluator.assign('a = b * 2')
+    evaluator.assign('c = a + d')
+    assert evaluator.names == {'b': 1, 'd': 0, 'a': 2, 'c': 2}
+    assert evaluator.reads['c'] == {'a', 'd'}
+
+    assert evaluator.add_condition('big', 'c > 5') is False
+    assert evaluator.add_condition('odd_d', 'd in (1, 3)') is False
+    flips = []
+    evaluator.subscribe(lambda key, old, new: flips.append((key, old, new)))
+
+    assert evaluator.update('b', 3) == [('big', False, True)]
+    assert evaluator.names['c'] == 6
+    assert evaluator.update('d', 1) == [('odd_d', False, True)]
+    assert evaluator.names['c'] == 7
+    assert evaluator.update('b', -3) == [('big', True, False)]
+    assert flips == [('big', False, True), ('odd_d', False, True), ('big', True, False)]
+
+    evaluated = []
+    evaluator.add_condition('spy', 'e > 0')
+    original = evaluator.evaluate
+    evaluator.evaluate = lambda key, tree, results: evaluated.append(key) or original(key, tree, results)
+    evaluator.update('d', 2)
+    assert evaluated == ['c', 'big', 'odd_d']
+    assert evaluator.condition_errors['spy'] == [('undefined', 'e')]
+
+    with pytest.raises(ValueError):
+        evaluator.assign('b = c')
+    assert 'b' not in evaluator.assignments
+    evaluator.assign('a = b + 10')
+    assert evaluator.names['c'] == 9
+
+    # a condition keyed by an assigned name keeps the reads of the assignment
+    evaluator = IncrementalEvaluator({'b': 1})
+    evaluator.assign('a = b * 2')
+    assert evaluator.add_condition('a', 'c > 5') is False
+    assert evaluator.update('b', 10) == []
+    assert evaluator.names['a'] == 20
+    assert evaluator.errors['a'] == [] and evaluator.condition_errors['a'] == [('undefined', 'c')]
+    assert evaluator.update('c', 6) == [('a', False, True)]
+
+
+def test_pickle_condition():
+    for backend in Condition.backends:
+        condition = pickle.loads(pickle.dumps(compile('a > 3 and b in (1, 2)', backend=backend)))
+        assert condition.backend == backend
+        assert condition.evaluate({'a': 4, 'b': 2}) is True
+
+
+def test_parallel_evaluator():
+    sources = ['a > 2 and b in (0, 2)', 'a * b - 1']
+    records = [{'a': number, 'b': number % 3} for number in range(50)]
+    expected = [[compile(source).evaluate(names) for source in sources] for names in records]
+    with ParallelEvaluator(sources, workers=2, chunk_size=7, min_parallel=0) as evaluator:
+        assert evaluator.evaluate(records) == expected
+    evaluator = ParallelEvaluator(sources, workers=2, chunk_size=7, min_parallel=100)
+    assert evaluator.evaluate(records) == expected
+    assert evaluator.pool is None
+
+
+def test_parallel_evaluator_columns():
+    np = pytest.importorskip('numpy')
+    from syntax_processor_batch import evaluate_batch
+
+    columns = {'a': np.arange(50), 'b': np.ma.MaskedArray(np.arange(50) % 3, mask=np.arange(50) % 11 == 0)}
+    sources = ['a > 2 and b in (0, 2)', 'a / b']
+    with ParallelEvaluator(sources, workers=2, chunk_size=7, min_parallel=0) as evaluator:
+        results = evaluator.evaluate_columns(columns)
+    for source, result in zip(sources, results):
+        expected = evaluate_batch(source, columns)
+        assert result.mask.tolist() == expected.mask.tolist()
+        assert result.tolist() == expected.tolist()
+
+    with ParallelEvaluator(['1 + 2 > 2'], workers=2, chunk_size=4, min_parallel=0) as evaluator:
+        assert evaluator.evaluate_columns({}, size=10)[0].tolist() == [True] * 10
+
+
+def test_condition_shared_by_threads():
+    conditions = [compile('(a * 2 > b) and c in (1, 2) or not d', backend=backend, reorder=reorder)
+                  for backend in Condition.backends for reorder in (False, True)
+                  if not (reorder and backend == 'slots')]
+    expected = compile('(a * 2 > b) and c in (1, 2) or not d')
+    failures = []
+
+    def work(seed):
+        for number in range(2000):
+            names = {'a': number % 5, 'b': seed % 7, 'c': number % 3}
+            if number % 4:
+                names['d'] = number % 2
+            for condition in conditions:
+                context = Context(dict(names))
+                result = context.evaluate(condition)
+                reference = Context(dict(names))
+                if result != reference.evaluate(expected) or len(context.errors) > 1:
+                    failures.append((seed, number))
+
+    threads = [threading.Thread(target=work, args=(seed,)) for seed in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not failures
+
+    with pytest.raises(AttributeError):
+        conditions[0].tree = None
+
+
+def test_evaluate_async():
+    values = {'a': 2, 'b': 0, 'c': 5}
+    calls = []
+    running = [0, 0]
+
+    async def resolver(name):
+        calls.append(name)
+        running[0] += 1
+        running[1] = max(running)
+        await asyncio.sleep(0.01)
+        running[0] -= 1
+        return values[name]
+
+    calls.clear()
+    assert asyncio.run(evaluate_async('a * c + a > b', resolver=resolver)) is True
+    assert sorted(calls) == ['a', 'b', 'c']
+    assert running[1] == 3
+
+    calls.clear()
+    assert asyncio.run(evaluate_async('b and c', resolver=resolver)) is False
+    assert calls == ['b']
+
+    calls.clear()
+    assert asyncio.run(evaluate_async('not (a < 1 or c in (1, 5)) + d', {'d': 1}, resolver)) is False
+    assert calls == ['a', 'c']
+
+    errors = []
+    resolvers = {'a': lambda: resolver('a')}
+    assert asyncio.run(evaluate_async('a + x', resolver=resolvers, errors=errors)) == 2
+    assert errors == [('undefined', 'x')]
+
+    sources = ['a * c + a > b', 'b and c', '(a or x) + c', 'x == (a or b)', 'not (b or a) in (0, 1)',
+               'f(a, b and x)', 'y = a + c', 'a in (b, c, a)']
+    for source in sources:
+        for reorder in (False, True):
+            condition = compile(source, reorder=reorder)
+            names = {}
+            expected_names = dict(values)
+            expected_errors = []
+            async_errors = []
+            expected = condition.evaluate(expected_names, expected_errors)
+            assert asyncio.run(evaluate_async(condition, names, resolver, async_errors)) == expected
+            assert async_errors == expected_errors
+            assert names.get('y') == expected_names.get('y')
+
+
+def test_functions():
+    lexer = ProcessorLexer()
+    parser = ProcessorParser()
+    parser.parse(lexer.tokenize('a = 7'))
+    assert parser.parse(lexer.tokenize('max(a, 3) + min(a, 3) > abs(-9)')) is True
+    assert parser.parse(lexer.tokenize('len(1, 2, 3) == 3')) is True
+    assert parser.parse(lexer.tokenize('any(0, a - 7) or all(1, a)')) is True
+    assert parser.parse(lexer.tokenize('f(1 + 2, a)')) == ('f', [3, 7])
+    assert not parser.errors
+
+    assert compile('max(1, 0x10) + x').simplified == '(16 + x)'
+    assert compile('max(x, 2) + f(1)').simplified == '(max(x, 2) + f(1))'
+    for backend in Condition.backends:
+        assert compile('len(x) > 1', backend=backend).evaluate({'x': [1, 2]}) is True
+
+    calls = []
+    functions.register('square', lambda value: calls.append(value) or value * value)
+    functions.register('counter', lambda: calls.append(None) or len(calls), pure=False)
+    try:
+        for backend in Condition.backends:
+            calls.clear()
+            condition = compile('square(x) > 10 and square(x) < 50', backend=backend)
+            assert condition.evaluate({'x': 5}) is True
+            assert condition.evaluate({'x': 6}) is True
+            assert calls == [5, 6]
+
+        calls.clear()
+        assert compile('square(3) + x').simplified == '(9 + x)'
+        assert compile('counter() + 0').simplified == '(counter() + 0)'
+        assert compile('counter() < counter()', backend='code').evaluate() is True
+
+        rule_set = RuleSet({'one': 'square(x) > 10', 'two': 'square(x) < 50',
+                            'three': 'counter() > 0', 'four': 'counter() > 1'})
+        calls.clear()
+        assert rule_set.match({'x': 5}) == ['one', 'two', 'three', 'four']
+        assert calls == [5, None, None]
+    finally:
+        functions.unregister('square')
+        functions.unregister('counter')
+
+
+def test_functions_batch_and_async():
+    np = pytest.importorskip('numpy')
+    from syntax_processor_batch import evaluate_batch
+
+    result = evaluate_batch('max(a, b) - min(a, 2) + abs(-a)', {'a': np.array([1, 5]), 'b': np.array([3, 0])})
+    assert result.tolist() == [3, 8]
+    with pytest.raises(ValueError):
+        evaluate_batch('f(a)', {'a': np.array([1])})
+
+    async def resolver(name):
+        return {'a': -4, 'b': 1}[name]
+    assert asyncio.run(evaluate_async('abs(a) > b and max(a, b) == 1', resolver=resolver)) is True
+
+
+def test_cached_parse_tables(tmp_path):
+    import os
+    import subprocess
+    import sys
+
+    # LRTable consumes the grammar, so the reference tables are built by a new process without a tables file
+    directory = os.path.dirname(os.path.abspath(__file__))
+    fresh = str(tmp_path / 'fresh.tables')
+    subprocess.run([sys.executable, '-c', 'import syntax_processor_parser'], check=True, cwd=directory,
+                   env={**os.environ, 'CONDITION_PROCESSOR_TABLES': fresh})
+    key = grammar_hash(ProcessorParser._grammar)
+    table = load_tables(fresh, key)
+    assert ProcessorParser._lrtable.lr_action == table.lr_action
+    assert ProcessorParser._lrtable.lr_goto == table.lr_goto
+
+    path = str(tmp_path / 'parser.tables')
+    assert load_tables(path, key) is None
+    assert save_tables(path, key, table)
+    cached = load_tables(path, key)
+    assert cached.lr_action == table.lr_action and cached.defaulted_states == table.defaulted_states
+    assert load_tables(path, 'other grammar') is None
+
+    (tmp_path / 'broken.tables').write_bytes(b'broken')
+    assert load_tables(str(tmp_path / 'broken.tables'), key) is None
+
+    code = 'import sys, syntax_processor_condition; print("syntax_processor_parser" in sys.modules)'
+    output = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True,
+                            cwd=directory).stdout
+    assert output.strip() == 'False'
+
+
+def test_serialized_conditions(tmp_path):
+    rules = {'range': 'x > 3 and (y in (1, 2, 3) or not z)', 'call': 'max(x, 2) * -y',
+             'broken': 'x +', 'set': 'q = 5', 'names': 'x in (a, b)'}
+    conditions = {name: compile(text) for name, text in rules.items()}
+    conditions['adaptive'] = compile('a > 1 and b < 2 and (c == 3)', reorder=True)
+    conditions['code'] = compile('a > 1 or b', backend='code')
+
+    loaded = loads(dumps(conditions))
+    for name, condition in conditions.items():
+        assert loaded[name].tree == condition.tree
+        assert (loaded[name].source, loaded[name].backend) == (condition.source, condition.backend)
+    assert loaded['broken'].errors == (None,)
+    assert loaded['range'].evaluate({'x': 4, 'y': 5, 'z': 0}) is True
+    assert loaded['code'].evaluate({'a': 0, 'b': 7}) is True
+
+    typed = loads(dumps({'typed': compile('a > 1 and b in (1, 2)', backend='code', schema={'a': 'float', 'b': int})}))
+    assert typed['typed'].schema == {'a': float, 'b': int} and typed['typed'].types
+
+    path = str(tmp_path / 'rules.spcf')
+    dump({'one': 'x > 1 and y', 'two': 'x > 1 and not y'}, path)
+    with load(path) as stored:
+        assert sorted(stored) == ['one', 'two']
+        assert stored['one'].tree.left == stored['two'].tree.left
+        rule_set = RuleSet(stored)
+    assert rule_set.match({'x': 2, 'y': 0}) == ['two']
+
+    data = bytearray(dumps({'one': 'x'}))
+    data[10] ^= 1
+    with pytest.raises(FormatError):
+        loads(bytes(data))
+    with pytest.raises(FormatError):
+        loads(b'not conditions')
+
+
+def test_metrics():
+    metrics = Metrics()
+    condition = metrics.compile('limit', 'x > 3 and y < 2')
+    assert [condition.evaluate({'x': x, 'y': 1}) for x in (1, 2, 5)] == [False, False, True]
+    assert condition.evaluate({'y': 1}) is False
+    metrics.compile('broken', 'x + $')
+    divide = metrics.compile('divide', 'x / y', backend='code')
+    with pytest.raises(ZeroDivisionError):
+        divide.evaluate({'x': 1, 'y': 0})
+
+    typed = metrics.compile('typed', 'x > 3 and y < 2', schema={'x': 'int', 'y': 'int'})
+    assert typed.condition.schema == {'x': int, 'y': int} and typed.condition.types
+
+    snapshot = metrics.snapshot()
+    assert snapshot['limit']['evaluations'] == 4
+    assert (snapshot['limit']['branches'], snapshot['limit']['short_circuits']) == (4, 3)
+    assert snapshot['limit']['short_circuit_rate'] == 0.75
+    assert snapshot['limit']['errors']['undefined'] == 1
+    assert snapshot['limit']['p99'] > 0
+    assert snapshot['broken']['errors'] == {'undefined': 0, 'parse': 1, 'lexer': 1, 'exception': 0}
+    assert snapshot['divide']['errors']['exception'] == 1
+
+    text = metrics.prometheus()
+    assert 'condition_evaluations_total{condition="limit"} 4' in text
+    assert 'condition_errors_total{condition="broken",kind="lexer"} 1' in text
+    assert '# TYPE condition_latency_seconds summary' in text
+
+    rule_set = RuleSet({'one': 'x > 1', 'two': 'x > 1 or y'})
+    profiled = metrics.profile(rule_set)
+    assert profiled.match({'x': 2}) == rule_set.match({'x': 2}) == ['one', 'two']
+    assert metrics.snapshot()['two']['short_circuits'] == 1
+
+    source = '(a * a + a * a > 3) and (b == 1) and c > 0'
+    adaptive = metrics.compile('adaptive', source, reorder=True).condition.tree
+    assert [entry[1] for entry in adaptive.order] == [entry[1] for entry in compile(source, reorder=True).tree.order]
+
+    disabled = Metrics(enabled=False)
+    plain = compile('x > 1')
+    assert disabled.instrument('plain', plain) is plain and disabled.profile(rule_set) is rule_set
+    assert disabled.snapshot() == {}
+
+
+def test_compact_nodes():
+    first = compile('count > 10 and (kind in (1, 2) or 10 == size)')
+    second = compile('count > 10 or total < 10')
+    assert not hasattr(first.tree, '__dict__')
+    assert first.tree.left.right is second.tree.left.right
+    assert first.tree.left.left.name is second.tree.left.left.name
+    assert pickle.loads(pickle.dumps(first)).tree == first.tree
+
+    report = memory_report(first, [second], {'rules': RuleSet({'one': 'count > 10'})})
+    assert report['trees'] == 3
+    assert report['types']['Number']['count'] == 1
+    assert report['bytes'] == report['node_bytes'] + report['value_bytes'] > 0
+    assert memory_report(second)['nodes'] == 6
+
+
+def test_slot_variables():
+    condition = compile('(count > 3 and kind in (1, 2)) or max(count, limit) > 10', backend='slots')
+    assert condition.variables == ('count', 'kind', 'limit')
+    errors = []
+    values = condition.bind({'count': 4, 'kind': 2}, errors)
+    assert values == (4, 2, 0) and errors == [('undefined', 'limit')]
+    assert condition.evaluate_values(values) is True
+    assert condition.evaluate_values((1, 1, 11)) is True
+    assert condition.evaluate_values((1, 1, 5)) is False
+    assert condition.evaluate({'count': 20}) is True
+
+    names = {'a': 1}
+    compile('b = a + 1', backend='slots').evaluate(names)
+    assert names == {'a': 1, 'b': 2}
+    with pytest.raises(ValueError):
+        compile('a > 1 and b < 2 and (c == 3)', backend='slots', reorder=True)
+    assert pickle.loads(pickle.dumps(condition)).evaluate_values((4, 2, 0)) is True
+    with pytest.raises(ValueError):
+        compile('a > 1').bind({'a': 2})
+
+
+def test_schema_type_check():
+    schema = {'status': 'int', 'level': int, 'ratio': 'float', 'flag': 'bool', 'items': 'list'}
+    text = '(status == 3) and level > 5 or status in (1, 2, 4) and not (flag)'
+    names = {'status': 2, 'level': 7, 'flag': 1}
+    for backend in Condition.backends:
+        condition = compile(text, backend=backend, schema=schema)
+        assert condition.evaluate(names) is compile(text).evaluate(names) is False
+        assert pickle.loads(pickle.dumps(condition)).evaluate({'status': 4}) is True
+    assert compile('flag and status > 1', backend='code', schema=schema).evaluate({'flag': 1, 'status': 2}) is True
+    assert compile('-ratio < 1 and max(items) > status', schema=schema).types is not None
+
+    for text, problem in [('level / 0 > 1', 'division by zero'), ('level / (2 - 2)', 'division by zero'),
+                          ('items > 3', 'unsupported operand types for >: list and int'),
+                          ('-items', 'bad operand type for unary -: list'),
+                          ('unknown > 1', "variable 'unknown' is not in the schema"),
+                          ('status in ()', '"in ()" has no list')]:
+        with pytest.raises(TypeCheckError) as error:
+            compile(text, schema=schema)
+        assert error.value.problems == [problem]
+    with pytest.raises(ValueError):
+        compile('a > 1', schema={'a': 'str'})
+
+    rule_set = RuleSet({'one': 'status > 1 and not flag', 'two': 'ratio < 1 or status in (7, 8)'}, schema=schema)
+    assert rule_set.match({'status': 7, 'flag': False, 'ratio': 1}) == ['one', 'two']
+    with pytest.raises(TypeCheckError):
+        rule_set.add('bad', 'items - 1')
+    with pytest.raises(TypeCheckError):
+        rule_set.add('bad', compile('items - 1'))
+    assert len(rule_set) == 2
+
+
+def test_cli(tmp_path, capsys):
+    events = tmp_path / 'events.jsonl'
+    events.write_text('{"level": 7, "status": 4}\n{"level": 2, "status": 5}\nbroken\n{"level": 9}\n')
+    table = tmp_path / 'events.csv'
+    table.write_text('level,status,host\n7,4,a\n2,5,b\n9,1,c\n')
+
+    assert syntax_processor_cli.main(['-c', 'level > 5', '-c', 'errors: status in (4, 5)', '--all', str(events)]) == 0
+    output = capsys.readouterr()
+    assert output.out == '{"level": 7, "status": 4}\n'
+    assert 'events.jsonl:3: not a JSON object' in output.err
+
+    assert syntax_processor_cli.main(['-c', 'level > 5', '-c', 'errors: status in (4, 5)', '--annotate',
+                                      '--summary', '--schema', 'level=int,status=int', str(table)]) == 0
+    output = capsys.readouterr()
+    assert output.out.splitlines() == ['level,status,host,matches', '7,4,a,level > 5 errors', '2,5,b,errors',
+                                       '9,1,c,level > 5']
+    assert 'records 3, written 3' in output.err and 'records/s' in output.err
+
+    assert syntax_processor_cli.main(['-c', 'level > 5', '--workers', '2', '--batch-size', '2',
+                                      str(events), str(table)]) == 0
+    assert capsys.readouterr().out.splitlines() == ['{"level": 7, "status": 4}', '{"level": 9}',
+                                                    '{"level": 7, "status": 4, "host": "a"}',
+                                                    '{"level": 9, "status": 1, "host": "c"}']
+
+    # records that can not be evaluated are reported and match nothing
+    numbers = tmp_path / 'numbers.jsonl'
+    numbers.write_text('{"a": 4, "b": 2}\n{"a": 4, "b": 0}\n{"a": 9, "b": 3}\n')
+    for workers in ('0', '2'):
+        assert syntax_processor_cli.main(['-c', 'a / b > 1', '--summary', '--workers', workers, str(numbers)]) == 0
+        output = capsys.readouterr()
+        assert output.out.splitlines() == ['{"a": 4, "b": 2}', '{"a": 9, "b": 3}']
+        assert 'record 2: ZeroDivisionError' in output.err and 'failed 1' in output.err
+    assert syntax_processor_cli.main(['-c', 'host > 1', str(table)]) == 0
+    output = capsys.readouterr()
+    assert output.out == ''
+    assert all(f'record {number}: TypeError' in output.err for number in (1, 2, 3))
+
+    rules = str(tmp_path / 'rules.spcf')
+    dump({'high': 'level > 5'}, rules)
+    assert syntax_processor_cli.main(['--rules', rules, '--schema', 'level=int', str(table)]) == 0
+    assert capsys.readouterr().out.splitlines() == ['level,status,host', '7,4,a', '9,1,c']
+    assert syntax_processor_cli.main(['--rules', rules, '--schema', 'level=list', str(table)]) == 2
+    assert 'unsupported operand types' in capsys.readouterr().err
+
+    assert syntax_processor_cli.main(['-c', 'level >', str(events)]) == 2
+    assert syntax_processor_cli.main(['-c', 'a = 1', str(events)]) == 2
+    assert syntax_processor_cli.main(['-c', 'level > 1', str(events), str(tmp_path / 'missing.jsonl')]) == 2
+    assert 'is an assignment' in capsys.readouterr().err
+    assert syntax_processor_cli.main(['-c', 'level > 1', '--schema', 'level=list', str(events)]) == 2